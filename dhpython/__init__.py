@@ -42,6 +42,21 @@ INTERPRETER_DIR_TPLS = {
 MULTIARCH_DIR_TPL = re.compile(
     '.*/([a-z][^/-]+-(?:linux|kfreebsd|gnu)(?:-[^/-]+)?)(?:/.*|$)')
 
+# the same rules as in PUBLIC_DIR_RE, INTERPRETER_DIR_TPLS and
+# MULTIARCH_DIR_TPL, but for a single path component (see fs.DirClassifier)
+PUBLIC_DIR_NAME_RE = {
+    'cpython2': re.compile(r'python(2\.\d)'),
+    'cpython3': re.compile(r'python(3(?:\.\d+)?)'),
+    'pypy': re.compile(r'pypy')}
+
+INTERPRETER_DIR_NAME_TPLS = {
+    'cpython2': r'python2\.\d',
+    'cpython3': r'python3(?:\.\d+)?',
+    'pypy': r'pypy'}
+
+MULTIARCH_DIR_NAME_RE = re.compile(
+    '[a-z][^/-]+-(?:linux|kfreebsd|gnu)(?:-[^/-]+)?')
+
 # Interpreter site-directories
 OLD_SITE_DIRS = {
     'cpython2': [
@@ -0,0 +1,125 @@
+# Copyright © 2026 dh-python developers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import logging
+import os
+import shutil
+from os.path import exists, isdir, islink, join, realpath
+
+from dhpython.tools import transfer_tree
+
+log = logging.getLogger('dhpython')
+
+
+def has_abi3_extensions_only(dpath):
+    """Check if directory contains *.abi3.so extensions and no other ones.
+
+    >>> has_abi3_extensions_only('/nonexistent')
+    False
+    """
+    extensions = [fn for root, dirs, file_names in os.walk(realpath(dpath))
+                  for fn in file_names if fn.endswith('.so')]
+    return bool(extensions) and all(fn.endswith('.abi3.so') for fn in extensions)
+
+
+class StableABIBuilds:
+    """Track versions that can reuse the oldest version's build (see --abi3).
+
+    :param mode: "yes" (always reuse), "auto" (reuse if the oldest version
+        built Stable ABI extensions only) or "no"
+    """
+
+    def __init__(self, mode='no'):
+        self.mode = mode
+        self.references = {}  # interpreter → the oldest version
+        self.detected = {}  # interpreter → True if reference build is reusable
+        self.built = set()  # (interpreter, version) built in this pybuild call
+
+    def sort(self, interpreter, versions, parallel=False):
+        """Move the oldest version to the front if its build can be reused.
+
+        :param versions: versions in the usual (build_sorted) order
+        :param parallel: True if versions are built at the same time
+        """
+        if self.mode == 'no' or len(versions) < 2:
+            return versions
+        if parallel and self.mode == 'auto':
+            # other versions would have to wait for the reference build
+            log.debug('Stable ABI builds are not detected in parallel mode,'
+                      ' use --abi3=yes to reuse them')
+            return versions
+        reference = min(versions)
+        self.references[interpreter] = reference
+        return [reference] + [v for v in versions if v != reference]
+
+    def reference(self, step, interpreter, version, get_args):
+        """Return version which build can be reused in given step (or None).
+
+        :param get_args: function that returns pybuild's arguments (home_dir
+            and build_dir) for given version
+        """
+        reference = self.references.get(interpreter)
+        if reference is None or reference == version:
+            return None
+        if self.mode == 'yes':
+            return reference
+        if interpreter in self.detected:
+            return reference if self.detected[interpreter] else None
+        if step == 'configure' and (interpreter, reference) not in self.built:
+            return None  # build from previous pybuild call can be outdated
+        args = get_args(reference)
+        if not exists(join(args['home_dir'], 'build.stamp')):
+            return None  # not built (successfully) yet
+        result = self.detected[interpreter] = has_abi3_extensions_only(args['build_dir'])
+        if result:
+            log.info('%s built Stable ABI extensions only, reusing its build'
+                     ' for other versions', interpreter.format(version=reference))
+        return reference if result else None
+
+    @staticmethod
+    def reuse(step, ref_args, args):
+        """Copy files built/installed for reference version.
+
+        Files are copied (not linked), later steps can modify them.
+
+        :param ref_args: pybuild's arguments of the reference version
+        :param args: pybuild's arguments of the current version
+        :return: False if there's nothing to reuse
+        """
+        if step == 'build':
+            src, dst = realpath(ref_args['build_dir']), args['build_dir']
+        else:
+            src = join(ref_args['destdir'], ref_args['install_dir'].lstrip('/'))
+            dst = join(args['destdir'], args['install_dir'].lstrip('/'))
+        if not isdir(src):
+            log.debug('%s not found, %s step cannot reuse it', src, step)
+            return False
+        if realpath(dst) == src:
+            return True
+        log.info('reusing files built for %s in %s step of %s',
+                 ref_args['interpreter'], step, args['interpreter'])
+        if step == 'build':
+            # build_dir can contain files built for this version previously
+            if islink(dst):
+                os.remove(dst)
+            elif isdir(dst):
+                shutil.rmtree(dst)
+        transfer_tree(src, dst, link=False)
+        return True
@@ -23,10 +23,9 @@ from functools import wraps
 from glob import glob1
 from os import remove, walk
 from os.path import exists, isdir, join
-from subprocess import Popen, PIPE
-from shutil import rmtree, copyfile, copytree
+from shutil import rmtree, which
 from dhpython.exceptions import RequiredCommandMissingException
-from dhpython.tools import execute
+from dhpython.tools import execute, transfer_file, transfer_tree
 try:
     from shlex import quote
 except ImportError:
@@ -67,10 +66,11 @@ def copy_test_files(dest='{build_dir}',
                 dst_dpath = join(dest.format(**args), name.rsplit('/', 1)[-1])
                 if exists(src_dpath):
                     if not exists(dst_dpath):
+                        # tests can modify these files, do not share inodes
                         if isdir(src_dpath):
-                            copytree(src_dpath, dst_dpath)
+                            transfer_tree(src_dpath, dst_dpath, link=False)
                         else:
-                            copyfile(src_dpath, dst_dpath)
+                            transfer_file(src_dpath, dst_dpath, link=False)
                         files_to_remove.add(dst_dpath + '\n')
                     if not args['args'] and 'PYBUILD_TEST_ARGS' not in context['ENV']\
                        and (self.cfg.test_pytest or self.cfg.test_nose) \
@@ -117,9 +117,7 @@ class Base:
     @classmethod
     def is_usable(cls):
         for command in cls.REQUIRED_COMMANDS:
-            process = Popen(['which', command], stdout=PIPE, stderr=PIPE)
-            out, err = process.communicate()
-            if process.returncode != 0:
+            if which(command) is None:
                 raise RequiredCommandMissingException(command)
 
     def detect(self, context):
@@ -238,7 +236,11 @@ class Base:
         if 'ENV' in args:
             env.update(args['ENV'])
         log.info(command)
-        return execute(command, context['dir'], env, log_file)
+        output = execute(command, context['dir'], env, log_file,
+                         prefix=context.get('output_prefix'))
+        if 'stats' in context:
+            context['stats'].append(dict(output['stats'], command=command))
+        return output
 
     def print_args(self, context, args):
         cfg = self.cfg
@@ -272,7 +274,7 @@ def shell_command(func):
                      args.get('interpreter'), args.get('version'))
             return command
 
-        if self.cfg.quiet:
+        if self.cfg.quiet or context.get('quiet'):
             log_file = join(args['home_dir'], '{}_cmd.log'.format(func.__name__))
         else:
             log_file = False
@@ -39,6 +39,7 @@ except ImportError:
     Installer = object
 
 from dhpython.build.base import Base, shell_command
+from dhpython.tools import transfer_file, transfer_tree
 
 log = logging.getLogger('dhpython')
 
@@ -74,11 +75,11 @@ class DebianInstaller(Installer):
         src = str(self.module.path)
         if self.module.is_package:
             log.info("Installing package %s -> %s", src, dst)
-            shutil.copytree(src, dst)
+            transfer_tree(src, dst, link=False)
             self._record_installed_directory(dst)
         else:
             log.info("Installing file %s -> %s", src, dst)
-            shutil.copy2(src, dst)
+            transfer_file(src, dst, link=False)
             self.installed_files.append(dst)
 
         scripts = self.ini_info.entrypoints.get('console_scripts', {})
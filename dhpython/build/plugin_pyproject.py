@@ -20,11 +20,16 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+from email.parser import Parser
 from pathlib import Path
+from zipfile import ZipFile
 import logging
+import os
 import os.path as osp
+import re
 import shutil
 import sysconfig
+import threading
 try:
     import tomli
 except ModuleNotFoundError:
@@ -38,6 +43,7 @@ except ModuleNotFoundError:
     SchemeDictionaryDestination = WheelFile = install = None
 
 from dhpython.build.base import Base, shell_command
+from dhpython.tools import transfer_file, transfer_tree
 
 log = logging.getLogger('dhpython')
 
@@ -49,6 +55,14 @@ class BuildSystem(Base):
     OPTIONAL_FILES = {}
     CLEAN_FILES = Base.CLEAN_FILES | {'build'}
 
+    def __init__(self, cfg):
+        super().__init__(cfg)
+        # pure Python wheel built for one interpreter, reused for others
+        # (as long as arguments passed to the build module are the same),
+        # versions can be built in parallel threads
+        self._pure_wheel = None
+        self._pure_wheel_lock = threading.Lock()
+
     def detect(self, context):
         """Return certainty level that this plugin describes the right build
         system
@@ -87,7 +101,12 @@ class BuildSystem(Base):
         if osp.exists(args['interpreter'].binary()):
             log.debug("removing '%s' (and everything under it)",
                       args['build_dir'])
-            osp.isdir(args['build_dir']) and shutil.rmtree(args['build_dir'])
+            if osp.islink(args['build_dir']):
+                os.remove(args['build_dir'])
+            elif osp.isdir(args['build_dir']):
+                shutil.rmtree(args['build_dir'])
+            staging_dir = osp.join(args['home_dir'], 'install')
+            osp.isdir(staging_dir) and shutil.rmtree(staging_dir)
         return 0  # no need to invoke anything
 
     def configure(self, context, args):
@@ -98,9 +117,36 @@ class BuildSystem(Base):
         return 0
 
     def build(self, context, args):
-        self.build_step1(context, args)
+        if not self.reuse_pure_wheel(context, args):
+            self.build_step1(context, args)
+            self.remember_pure_wheel(context, args)
         self.build_step2(context, args)
 
+    def reuse_pure_wheel(self, context, args):
+        """Copy wheel built for another interpreter if it is a pure one.
+
+        :return: True if wheel was reused, False if it has to be built
+        """
+        with self._pure_wheel_lock:
+            if self._pure_wheel is None:
+                return False
+            wheel, build_args = self._pure_wheel
+        if build_args != args['args'] or not wheel.exists():
+            return False
+        log.info('Reusing pure Python wheel %s for %s', wheel.name,
+                 args['interpreter'])
+        Path(args['home_dir']).mkdir(parents=True, exist_ok=True)
+        transfer_file(wheel, osp.join(args['home_dir'], wheel.name))
+        return True
+
+    def remember_pure_wheel(self, context, args):
+        wheels = list(Path(args['home_dir']).glob('*.whl'))
+        if len(wheels) == 1 and is_pure_wheel(wheels[0]):
+            log.debug('%s is a pure Python wheel, it will be reused for other'
+                      ' interpreters', wheels[0].name)
+            with self._pure_wheel_lock:
+                self._pure_wheel = (wheels[0], args['args'])
+
     @shell_command
     def build_step1(self, context, args):
         """ build a wheel using the PEP517 builder defined by upstream """
@@ -115,87 +161,145 @@ class BuildSystem(Base):
                )
 
     def build_step2(self, context, args):
-        """ unpack the wheel into pybuild's normal  """
+        """ install the wheel into a staging tree laid out like destdir
+
+        build_dir becomes a lightweight view of installed modules (used by
+        tests), install step copies staging tree to destdir.
+        """
         log.info('Unpacking wheel built for %s with "installer" module',
                  args['interpreter'])
-        extras = {}
-        for extra in ('scripts', 'data'):
-            path = Path(args["home_dir"]) / extra
-            if osp.exists(path):
-                log.warning(f'{extra.title()} directory already exists, '
-                            'skipping unpack. '
-                            'Is the Python package being built twice?')
-                return
-            extras[extra] = path
+        staging_dir = Path(args['home_dir']) / 'install'
+        if staging_dir.exists():
+            # left by previous build, do not install stale files
+            log.debug('removing %s', staging_dir)
+            shutil.rmtree(staging_dir)
+        wheel = self.select_wheel(args)
+        paths = scheme_paths()
+        module_dir = str(staging_dir) + args['install_dir']
         destination = SchemeDictionaryDestination(
             {
-                'platlib': args['build_dir'],
-                'purelib': args['build_dir'],
-                'scripts': extras['scripts'],
-                'data': extras['data'],
+                'platlib': module_dir,
+                'purelib': module_dir,
+                'scripts': str(staging_dir) + paths['scripts'],
+                'data': str(staging_dir) + paths['data'],
             },
             interpreter=args['interpreter'].binary_dv,
             script_kind='posix',
         )
+        with WheelFile.open(wheel) as source:
+            install(
+                source=source,
+                destination=destination,
+                additional_metadata={},
+            )
 
-        # FIXME this next step will unpack every single wheel file it finds
-        # which is probably ok since each wheel is built in a separate
-        # directory; but perhaps it should only accept the correctly named
-        # wheels that match the current interpreter?
-        # python-packaging has relevant utilities in
-        #   - packaging/utils.py::parse_wheel_filename
-        #   - packaging/tags.py (although it is current-interpreter-centric)
-        wheels = Path(args['home_dir']).glob('*.whl')
-        for wheel in wheels:
+        build_dir = args['build_dir']
+        os.makedirs(module_dir, exist_ok=True)
+        if osp.islink(build_dir):
+            os.remove(build_dir)
+        elif osp.isdir(build_dir) and not os.listdir(build_dir):
+            os.rmdir(build_dir)
+        if osp.exists(build_dir):
+            # do not remove files that are already there
+            transfer_tree(module_dir, build_dir)
+        else:
+            os.symlink(module_dir, build_dir)
+
+    def select_wheel(self, args):
+        """Return the wheel that matches current interpreter's tags"""
+        wheels = []
+        for wheel in Path(args['home_dir']).glob('*.whl'):
             if wheel.name.startswith('UNKNOWN'):
                 raise Exception(f'UNKNOWN wheel found: {wheel.name}. Does '
                                 'pyproject.toml specify a build-backend?')
-            with WheelFile.open(wheel) as source:
-                install(
-                    source=source,
-                    destination=destination,
-                    additional_metadata={},
-                )
+            if is_compatible_wheel(wheel, args['version']):
+                wheels.append(wheel)
+            else:
+                log.debug('ignoring %s, it does not support Python %s',
+                          wheel.name, args['version'])
+        if not wheels:
+            raise Exception('cannot find a wheel built for Python {} in {}'
+                            .format(args['version'], args['home_dir']))
+        wheels.sort(key=lambda path: path.stat().st_mtime)
+        if len(wheels) > 1:
+            log.warning('more than one wheel built for Python %s found, '
+                        'using the newest one: %s', args['version'],
+                        wheels[-1].name)
+        return wheels[-1]
 
     def install(self, context, args):
         log.info('Copying package built for %s to destdir',
                  args['interpreter'])
-        try:
-            paths = sysconfig.get_paths(scheme='deb_system')
-        except KeyError:
-            # Debian hasn't patched sysconfig schemes until 3.10
-            # TODO: Introduce a version check once sysconfig is patched.
-            paths = sysconfig.get_paths(scheme='posix_prefix')
-
-        # start by copying the data and scripts
-        for extra in ('data', 'scripts'):
-            src_dir = Path(args['home_dir']) / extra
-            if not src_dir.exists():
-                continue
-            target_dir = args['destdir'] + paths[extra]
-            log.debug('Copying %s directory contents from %s -> %s',
-                      extra, src_dir, target_dir)
-            shutil.copytree(
-                src_dir,
-                target_dir,
-                dirs_exist_ok=True,
-            )
-
-        # then copy the modules
-        module_dir = args['build_dir']
-        target_dir = args['destdir'] + args['install_dir']
-        log.debug('Copying module contents from %s -> %s',
-                  module_dir, target_dir)
-        shutil.copytree(
-            module_dir,
-            target_dir,
-            dirs_exist_ok=True,
-        )
+        staging_dir = osp.join(args['home_dir'], 'install')
+        log.debug('Copying staging directory contents from %s -> %s',
+                  staging_dir, args['destdir'])
+        # The wheel is not installed into destdir again: installer refuses
+        # to overwrite files installed for other interpreters there. Staged
+        # files are not moved either (test step uses them) nor hard linked
+        # (files in destdir are modified in place later, f.e. by dh_strip),
+        # so they are copied (reflinked if the file system supports it).
+        transfer_tree(staging_dir, args['destdir'], link=False)
 
     @shell_command
     def test(self, context, args):
-        scripts = Path(args["home_dir"]) / 'scripts'
+        scripts = Path(args['home_dir'] + '/install' +
+                       scheme_paths()['scripts'])
         if scripts.exists():
             context['ENV']['PATH'] = f"{scripts}:{context['ENV']['PATH']}"
         context['ENV']['HOME'] = args['home_dir']
         return super().test(context, args)
+
+
+def is_pure_wheel(path):
+    """Check if wheel works with any Python 3 version and architecture.
+
+    Both filename tags and Root-Is-Purelib in .dist-info/WHEEL have to agree.
+    """
+    parts = path.stem.split('-')
+    if len(parts) not in (5, 6):
+        return False
+    python_tags, abi_tag, platform_tag = parts[-3:]
+    if 'py3' not in python_tags.split('.') or abi_tag != 'none' \
+            or platform_tag != 'any':
+        return False
+    try:
+        with ZipFile(path) as zfile:
+            for name in zfile.namelist():
+                if name.count('/') == 1 and name.endswith('.dist-info/WHEEL'):
+                    metadata = Parser().parsestr(zfile.read(name).decode())
+                    return metadata.get('Root-Is-Purelib', '').lower() == 'true'
+    except Exception as err:
+        log.debug('cannot read %s: %s', path, err)
+    return False
+
+
+def is_compatible_wheel(path, version):
+    """Check if wheel's filename tags allow using it with given Python version.
+
+    Platform tag is not checked, wheels are built for the host architecture.
+    """
+    parts = path.stem.split('-')
+    if len(parts) not in (5, 6):
+        return False
+    python_tags, abi_tags = (set(i.split('.')) for i in parts[-3:-1])
+    cp_tag = 'cp{}{}'.format(version.major, version.minor)
+    if not abi_tags & {'none', 'abi3', cp_tag, cp_tag + 'd', cp_tag + 'm'}:
+        return False
+    for tag in python_tags:
+        if tag in {'py3', 'py{}{}'.format(version.major, version.minor), cp_tag}:
+            return True
+        # stable ABI: cp3Y-abi3 works with Python 3.Y and newer
+        match = re.match(r'cp3(\d+)$', tag)
+        if match and 'abi3' in abi_tags and int(match.group(1)) <= version.minor:
+            return True
+    return False
+
+
+def scheme_paths():
+    """Return sysconfig paths of the scheme used for installing packages"""
+    try:
+        return sysconfig.get_paths(scheme='deb_system')
+    except KeyError:
+        # Debian hasn't patched sysconfig schemes until 3.10
+        # TODO: Introduce a version check once sysconfig is patched.
+        return sysconfig.get_paths(scheme='posix_prefix')
@@ -0,0 +1,109 @@
+# Copyright © 2026 dh-python developers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+log = logging.getLogger('dhpython')
+
+
+class Scheduler:
+    """Invoke tasks (with dependencies between them) using a pool of threads.
+
+    Tasks are started in the order they were added, as soon as all tasks
+    they depend on are done. With jobs=1 they're invoked one by one (in the
+    main thread).
+
+    >>> s = Scheduler(jobs=2)
+    >>> s.add('a', print, 'a')
+    >>> s.add('b', print, 'b', deps=['a'])
+    >>> s.run()
+    a
+    b
+    """
+
+    def __init__(self, jobs=1):
+        self.jobs = jobs
+        self.tasks = {}
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def add(self, key, func, *args, deps=(), name=None):
+        """Add a new task.
+
+        :param key: unique task identifier (used in `deps` of other tasks)
+        :param deps: keys of tasks that have to be finished first
+            (these tasks have to be added before this one)
+        :param name: thread name used while task is running (it can be
+            included in log messages)
+        """
+        if key in self.tasks:
+            raise ValueError('task already added: {}'.format(key))
+        deps = set(deps)
+        for dep in deps:
+            if dep not in self.tasks:
+                raise ValueError('unknown dependency of {}: {}'.format(key, dep))
+        self.tasks[key] = (func, args, deps, name)
+
+    @staticmethod
+    def _invoke(name, func, args):
+        if name:
+            threading.current_thread().name = name
+        return func(*args)
+
+    def run(self):
+        """Invoke all tasks.
+
+        No new task is started once one of them fails, its exception is
+        raised after all running tasks are finished.
+        """
+        if self.jobs <= 1:
+            for func, args, deps, name in self.tasks.values():
+                func(*args)
+            return
+
+        pending = dict(self.tasks)
+        done = set()
+        running = {}
+        error = None
+        with ThreadPoolExecutor(self.jobs) as executor:
+            while pending or running:
+                if error is None:
+                    for key, (func, args, deps, name) in list(pending.items()):
+                        if len(running) >= self.jobs:
+                            break
+                        if deps <= done:
+                            del pending[key]
+                            future = executor.submit(self._invoke, name, func, args)
+                            running[future] = key
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    key = running.pop(future)
+                    if future.exception() is None:
+                        done.add(key)
+                    elif error is None:
+                        log.debug('%s failed, not starting new tasks', key)
+                        error = future.exception()
+        if error is not None:
+            raise error
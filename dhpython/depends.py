@@ -19,9 +19,11 @@
 # THE SOFTWARE.
 
 import logging
+import os
 from functools import partial
-from os.path import exists, join
-from dhpython import PKG_PREFIX_MAP, MINPYCDEP
+from os.path import exists, isdir, join
+from dhpython import (PKG_PREFIX_MAP, PYDIST_DIRS, PYDIST_OVERRIDES_FNAMES,
+                      MINPYCDEP)
 from dhpython.pydist import parse_pydep, parse_requires_dist, guess_dependency
 from dhpython.version import default, supported, VersionRange
 
@@ -113,6 +115,31 @@ class Dependencies:
         if value not in self.rtscripts:
             self.rtscripts.append(value)
 
+    def input_files(self, stats, options):
+        """Return files read by :meth:`parse` (directly or via dpkg).
+
+        Together with stats and options their details can tell if parse()
+        would generate the same relations again.
+        """
+        result = []
+        if options.guess_deps:
+            result.extend(sorted(stats['requires.txt']))
+            result.extend(sorted(stats['egg-info']))
+            result.extend(sorted(stats['dist-info']))
+        for fn in options.requires or []:
+            result.append(join('debian', self.package, fn))
+            result.append(fn)
+        # see pydist.load and pydist.guess_dependency
+        result.append(PYDIST_OVERRIDES_FNAMES[self.impl])
+        dname = PYDIST_DIRS[self.impl]
+        result.append(dname)
+        if isdir(dname):
+            result.extend(join(dname, i) for i in sorted(os.listdir(dname)))
+        result.append(join(os.environ.get('DH_PYTHON_DIST', '/usr/share/dh-python/dist/'),
+                           '{}_fallback'.format(self.impl)))
+        result.append('/var/lib/dpkg/status')
+        return result
+
     def parse(self, stats, options):
         log.debug('generating dependencies for package %s', self.package)
         tpl = self.ipkg_tpl
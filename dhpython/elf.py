@@ -0,0 +1,112 @@
+# Copyright © 2026 dh-python developers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+"""Minimal reader of ELF shared objects (no readelf/objdump needed)."""
+
+import logging
+import struct
+from collections import namedtuple
+from mmap import mmap, ACCESS_READ
+
+log = logging.getLogger('dhpython')
+
+SHT_DYNAMIC = 6
+SHT_DYNSYM = 11
+DT_NULL = 0
+DT_NEEDED = 1
+DT_SONAME = 14
+SHN_UNDEF = 0
+STB_LOCAL = 0
+
+# struct formats: ELF header (from e_type), section header, dynamic entry, symbol
+_FORMATS = {
+    1: ('HHIIIIIHHHHHH', 'IIIIIIIIII', 'iI', 'IIIBBH'),  # ELFCLASS32
+    2: ('HHIQQQIHHHHHH', 'IIQQQQIIQQ', 'qQ', 'IBBHQQ'),  # ELFCLASS64
+}
+
+ELFInfo = namedtuple('ELFInfo', 'needed soname defined undefined')
+ELFInfo.__doc__ = """Details read from ELF file's dynamic section and symbol table.
+
+:attr needed: names of needed libraries (DT_NEEDED entries), in order
+:attr soname: DT_SONAME entry (or None)
+:attr defined: names of exported (global or weak) dynamic symbols
+:attr undefined: names of dynamic symbols provided by other objects
+"""
+
+
+def read_elf(fpath):
+    """Return ELFInfo of given shared object or None if it's not an ELF file.
+
+    Only section headers are used, so files without them (f.e. processed by
+    sstrip) are reported as files without dynamic section.
+    """
+    try:
+        with open(fpath, 'rb') as fp, mmap(fp.fileno(), 0, access=ACCESS_READ) as data:
+            return _parse(data)
+    except (OSError, ValueError, struct.error) as err:
+        log.debug('cannot read ELF file %s: %s', fpath, err)
+
+
+def _parse(data):
+    if data[:4] != b'\x7fELF':
+        return
+    elf_class, byte_order = data[4], data[5]
+    if elf_class not in _FORMATS or byte_order not in (1, 2):
+        raise ValueError('unsupported ELF class or data encoding')
+    order = '<' if byte_order == 1 else '>'
+    hdr_fmt, sh_fmt, dyn_fmt, sym_fmt = (struct.Struct(order + i)
+                                         for i in _FORMATS[elf_class])
+
+    header = hdr_fmt.unpack_from(data, 16)
+    shoff, shentsize, shnum = header[5], header[10], header[11]
+    # name, type, flags, addr, offset, size, link, info, addralign, entsize
+    sections = [sh_fmt.unpack_from(data, shoff + i * shentsize)
+                for i in range(shnum)] if shoff else []
+
+    def string(section, offset):
+        start = sections[section][4] + offset
+        return data[start:data.find(b'\0', start)].decode('utf-8', 'replace')
+
+    needed, soname = [], None
+    defined, undefined = set(), set()
+    for section in sections:
+        stype, offset, size, link = section[1], section[4], section[5], section[6]
+        if stype == SHT_DYNAMIC:
+            for tag, value in dyn_fmt.iter_unpack(data[offset:offset + size - size % dyn_fmt.size]):
+                if tag == DT_NULL:
+                    break
+                if tag == DT_NEEDED:
+                    needed.append(string(link, value))
+                elif tag == DT_SONAME:
+                    soname = string(link, value)
+        elif stype == SHT_DYNSYM:
+            for sym in sym_fmt.iter_unpack(data[offset:offset + size - size % sym_fmt.size]):
+                if elf_class == 1:
+                    name, info, shndx = sym[0], sym[3], sym[5]
+                else:
+                    name, info, shndx = sym[0], sym[1], sym[3]
+                if not name or info >> 4 == STB_LOCAL:
+                    continue
+                if shndx == SHN_UNDEF:
+                    undefined.add(string(link, name))
+                else:
+                    defined.add(string(link, name))
+    return ELFInfo(needed, soname, defined, undefined)
@@ -24,122 +24,285 @@ import logging
 import os
 import re
 import sys
-from filecmp import cmp as cmpfile
-from glob import glob
-from os.path import (lexists, exists, getsize, isdir, islink, join, realpath,
-                     relpath, split, splitext)
-from shutil import rmtree
-from stat import ST_MODE, S_IXUSR, S_IXGRP, S_IXOTH
-from dhpython import MULTIARCH_DIR_TPL
-from dhpython.tools import fix_shebang, clean_egg_name
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import chain
+from mmap import mmap, ACCESS_READ
+from multiprocessing import get_context
+from os.path import getsize, join, realpath, relpath, split, splitext
+from stat import S_ISREG, S_IXUSR, S_IXGRP, S_IXOTH
+from dhpython import (INTERPRETER_DIR_NAME_TPLS, MULTIARCH_DIR_NAME_RE,
+                      MULTIARCH_DIR_TPL, PUBLIC_DIR_NAME_RE)
+from dhpython.tools import (capture_logs, captured_logs, clean_egg_name,
+                            fix_shebang, parallel_jobs, rewrite_shebangs,
+                            shebang_replacement)
+from dhpython.elf import read_elf
 from dhpython.interpreter import Interpreter
+from dhpython.manifest import canonical, dir_fingerprint
+from dhpython.stable_abi import uses_stable_abi
+from dhpython.tree import TreeIndex
+from dhpython.version import Version, supported
 
 log = logging.getLogger('dhpython')
 
 
-def fix_locations(package, interpreter, versions, options):
-    """Move files to the right location."""
+def fix_locations(package, interpreter, versions, options, tree=None):
+    """Move files to the right location.
+
+    :param tree: index of package's files
+    :type tree: TreeIndex
+    """
+    if tree is None:
+        tree = TreeIndex()
     # make a copy since we change version later
     interpreter = Interpreter(interpreter)
 
+    moves = []  # (version, srcdir, dstdir)
     for version in versions:
         interpreter.version = version
 
         dstdir = interpreter.sitedir(package)
         for srcdir in interpreter.old_sitedirs(package):
-            if isdir(srcdir):
-                # TODO: what about relative symlinks?
-                log.debug('moving files from %s to %s', srcdir, dstdir)
-                share_files(srcdir, dstdir, interpreter, options)
-                try:
-                    os.removedirs(srcdir)
-                except OSError:
-                    pass
+            if tree.isdir(srcdir):
+                moves.append((version, srcdir, dstdir))
 
         # do the same with debug locations
         dstdir = interpreter.sitedir(package, gdb=True)
         for srcdir in interpreter.old_sitedirs(package, gdb=True):
-            if isdir(srcdir):
-                log.debug('moving files from %s to %s', srcdir, dstdir)
-                share_files(srcdir, dstdir, interpreter, options)
-                try:
-                    os.removedirs(srcdir)
-                except OSError:
-                    pass
+            if tree.isdir(srcdir):
+                moves.append((version, srcdir, dstdir))
 
         # move files from /usr/include/pythonX.Y/ to …/pythonX.Ym/
         if interpreter.symlinked_include_dir:
             srcdir = "debian/%s%s" % (package, interpreter.symlinked_include_dir)
-            if srcdir and isdir(srcdir):
+            if srcdir and tree.isdir(srcdir):
                 dstdir = "debian/%s%s" % (package, interpreter.include_dir)
-                log.debug('moving files from %s to %s', srcdir, dstdir)
-                share_files(srcdir, dstdir, interpreter, options)
-                try:
-                    os.removedirs(srcdir)
-                except OSError:
-                    pass
+                moves.append((version, srcdir, dstdir))
+
+    # hash files that will be compared while merging in parallel, once
+    digests = FileDigests()
+    trees = {}
+    for version, srcdir, dstdir in moves:
+        trees.setdefault(dstdir, [dstdir]).append(srcdir)
+    for dirs in trees.values():
+        if len(dirs) > 2 or tree.isdir(dirs[0]):
+            digests.prefetch(dirs, tree=tree)
+
+    # directories are merged one by one rather than resolved in one pass:
+    # share_files renames extensions and merges dist-info files as it goes,
+    # so each merge depends on the result of the previous ones (digests are
+    # cached, files are still read at most once)
+    for version, srcdir, dstdir in moves:
+        interpreter.version = version
+        # TODO: what about relative symlinks?
+        log.debug('moving files from %s to %s', srcdir, dstdir)
+        share_files(srcdir, dstdir, interpreter, options, digests, tree)
+        try:
+            tree.removedirs(srcdir)
+        except OSError:
+            pass
+
+
+class FileDigests:
+    """Cache of SHA-256 digests of files' content.
+
+    Digests are keyed by device, inode, size and mtime, so they are still
+    valid after moving files to another directory and are invalidated
+    when a file is modified.
+    """
+    # files bigger than this are mapped into memory instead of being read
+    MMAP_THRESHOLD = 1024 * 1024
+
+    def __init__(self):
+        self._digests = {}
+
+    def get(self, fpath):
+        """Return digest of given file's content."""
+        stat = os.stat(fpath)
+        key = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        digest = self._digests.get(key)
+        if digest is None:
+            digest = self._digests[key] = self._compute(fpath, stat.st_size)
+        return digest
+
+    def _compute(self, fpath, size):
+        result = hashlib.sha256()
+        with open(fpath, 'rb') as fp:
+            if size >= self.MMAP_THRESHOLD:
+                with mmap(fp.fileno(), 0, access=ACCESS_READ) as data:
+                    result.update(data)
+            else:
+                for chunk in iter(lambda: fp.read(65536), b''):
+                    result.update(chunk)
+        return result.digest()
+
+    def same(self, fpath1, fpath2):
+        """Check if files have the same content (like filecmp.cmp)."""
+        stat1, stat2 = os.stat(fpath1), os.stat(fpath2)
+        if stat1.st_size != stat2.st_size:
+            return False
+        if (stat1.st_dev, stat1.st_ino) == (stat2.st_dev, stat2.st_ino):
+            return True
+        return self.get(fpath1) == self.get(fpath2)
+
+    def prefetch(self, dirs, jobs=None, tree=None):
+        """Compute digests of files that can be compared later, in parallel.
+
+        Only regular files with the same path (relative to one of dirs)
+        and size in at least two of dirs are read.
+
+        :type tree: TreeIndex
+        """
+        if tree is None:
+            tree = TreeIndex()
+        candidates = {}
+        for dpath in dirs:
+            for root, _, file_names in tree.walk(dpath):
+                for fn in file_names:
+                    fpath = join(root, fn)
+                    if tree.islink(fpath):
+                        continue
+                    key = (relpath(fpath, dpath), getsize(fpath))
+                    candidates.setdefault(key, []).append(fpath)
+        fpaths = [fpath for group in candidates.values() if len(group) > 1
+                  for fpath in group]
+        if not fpaths:
+            return
+        log.debug('computing digests of %d files in %s', len(fpaths),
+                  ', '.join(dirs))
+        # hashlib releases the GIL while hashing, threads are good enough here
+        with ThreadPoolExecutor(jobs or parallel_jobs()) as executor:
+            for _ in executor.map(self.get, fpaths):
+                pass
+
+
+class FileKinds:
+    """Cache of files' kinds.
+
+    Each file is opened once and only its first bytes are read. Results
+    are keyed by device, inode, size and mtime (just like in FileDigests).
+    Recognized kinds: elf, script (starts with a shebang), binary, text
+    and other (not a regular file). Details of ELF files are cached as well.
+    """
+    # enough to parse a shebang, see Interpreter.from_file
+    HEAD_SIZE = 96
+
+    def __init__(self):
+        self._kinds = {}
+        self._elf = {}
 
+    def get(self, fpath, stat=None):
+        """Return (kind, mode, first bytes) tuple for given file.
 
-def share_files(srcdir, dstdir, interpreter, options):
-    """Try to move as many files from srcdir to dstdir as possible."""
+        :param stat: os.stat() result of this file, if already available
+        """
+        if stat is None:
+            stat = os.stat(fpath)
+        key = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        result = self._kinds.get(key)
+        if result is None:
+            result = self._kinds[key] = self._classify(fpath, stat)
+        return result
+
+    def elf(self, fpath, stat=None):
+        """Return ELFInfo of given file or None if it's not an ELF file.
+
+        :param stat: os.stat() result of this file, if already available
+        """
+        if stat is None:
+            stat = os.stat(fpath)
+        key = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        if key not in self._elf:
+            kind = self.get(fpath, stat)[0]
+            self._elf[key] = read_elf(fpath) if kind == 'elf' else None
+        return self._elf[key]
+
+    def _classify(self, fpath, stat):
+        if not S_ISREG(stat.st_mode):
+            return 'other', stat.st_mode, b''
+        with open(fpath, 'rb') as fp:
+            head = fp.read(self.HEAD_SIZE)
+        if head.startswith(b'\x7fELF'):
+            kind = 'elf'
+        elif b'\0' in head:
+            kind = 'binary'
+        elif head.startswith(b'#!'):
+            kind = 'script'
+        else:
+            kind = 'text'
+        return kind, stat.st_mode, head
+
+
+def share_files(srcdir, dstdir, interpreter, options, digests=None, tree=None):
+    """Try to move as many files from srcdir to dstdir as possible.
+
+    :param digests: cache of file digests used to compare files
+    :type digests: FileDigests
+    :param tree: index of package's files
+    :type tree: TreeIndex
+    """
+    if digests is None:
+        digests = FileDigests()
+    if tree is None:
+        tree = TreeIndex()
     cleanup_actions = []
-    for i in os.listdir(srcdir):
+    public_version = interpreter.parse_public_dir(srcdir)
+    for i in tree.listdir(srcdir):
         fpath1 = join(srcdir, i)
-        if not lexists(fpath1):  # removed in rename_ext
+        if not tree.lexists(fpath1):  # removed in rename_ext
             continue
         if i.endswith('.pyc'):  # f.e. when tests were invoked on installed files
-            os.remove(fpath1)
+            tree.remove(fpath1)
             continue
         if not options.no_ext_rename and splitext(i)[-1] == '.so':
             # try to rename extension here as well (in :meth:`scan` info about
             # Python version is gone)
-            version = interpreter.parse_public_dir(srcdir)
-            if version and version is not True:
-                fpath1 = Scan.rename_ext(fpath1, interpreter, version)
+            if public_version and public_version is not True:
+                fpath1 = Scan.rename_ext(fpath1, interpreter, public_version,
+                                         tree, detect_abi3=options.detect_abi3)
                 i = split(fpath1)[-1]
         if srcdir.endswith(".dist-info"):
             if i in ('COPYING', 'LICENSE') or i.startswith(
                     ('COPYING.', 'LICENSE.')):
-                os.remove(fpath1)
+                tree.remove(fpath1)
                 cleanup_actions.append((remove_from_RECORD, ([i],)))
                 continue
-            elif isdir(fpath1) and i in ('licenses', 'license_files'):
+            elif tree.isdir(fpath1) and i in ('licenses', 'license_files'):
                 cleanup_actions.append((
                     remove_from_RECORD,
                     ([
                         relpath(license, srcdir)
-                        for license in glob(join(srcdir, i, '**'))
+                        for license in tree.glob(join(srcdir, i, '**'))
                     ],)
                 ))
-                rmtree(fpath1)
+                tree.rmtree(fpath1)
                 continue
         fpath2 = join(dstdir, i)
-        if not isdir(fpath1) and not exists(fpath2):
+        if not tree.isdir(fpath1) and not tree.exists(fpath2):
             # do not rename directories here - all .so files have to be renamed first
-            os.renames(fpath1, fpath2)
+            tree.renames(fpath1, fpath2)
             continue
-        if islink(fpath1):
+        if tree.islink(fpath1):
             # move symlinks without changing them if they point to the same place
-            if not exists(fpath2):
-                os.renames(fpath1, fpath2)
+            if not tree.exists(fpath2):
+                tree.renames(fpath1, fpath2)
             elif realpath(fpath1) == realpath(fpath2):
-                os.remove(fpath1)
-        elif isdir(fpath1):
-            share_files(fpath1, fpath2, interpreter, options)
-        elif cmpfile(fpath1, fpath2, shallow=False):
-            os.remove(fpath1)
-        elif i.endswith(('.abi3.so', '.abi4.so')) and interpreter.parse_public_dir(srcdir):
+                tree.remove(fpath1)
+        elif tree.isdir(fpath1):
+            share_files(fpath1, fpath2, interpreter, options, digests, tree)
+        elif digests.same(fpath1, fpath2):
+            tree.remove(fpath1)
+        elif i.endswith(('.abi3.so', '.abi4.so')) and public_version:
             log.warning('%s differs from previous one, removing anyway (%s)', i, srcdir)
-            os.remove(fpath1)
+            tree.remove(fpath1)
         elif srcdir.endswith(".dist-info"):
             # dist-info file that differs... try merging
             if i == "WHEEL":
                 if merge_WHEEL(fpath1, fpath2):
                     cleanup_actions.append((fix_merged_RECORD, ()))
-                os.remove(fpath1)
+                tree.remove(fpath1)
             elif i == "RECORD":
                 merge_RECORD(fpath1, fpath2)
-                os.remove(fpath1)
+                tree.remove(fpath1)
             else:
                 log.warn("No merge driver for dist-info file %s", i)
         else:
@@ -156,7 +319,7 @@ def share_files(srcdir, dstdir, interpreter, options):
     for action, args in cleanup_actions:
         action(dstdir, *args)
     try:
-        os.removedirs(srcdir)
+        tree.removedirs(srcdir)
     except OSError:
         pass
 
@@ -260,43 +423,162 @@ def remove_from_RECORD(distdir, files):
         fh.writelines(sorted(filtered))
 
 
+class DirClassifier:
+    """Classify directories one path component at a time.
+
+    It gives the same answers as Interpreter.should_ignore,
+    Interpreter.parse_public_dir and MULTIARCH_DIR_TPL, without matching
+    regular expressions against whole paths: a directory inherits state
+    of its (memoized) parent and only its own name is checked. States
+    computed for (parent's state, name) pairs are reused as well.
+    """
+
+    def __init__(self, impl):
+        self._other_impl_re = re.compile('|'.join(
+            tpl for i, tpl in INTERPRETER_DIR_NAME_TPLS.items() if i != impl))
+        self._public_re = PUBLIC_DIR_NAME_RE[impl]
+        self._dirs = {}
+        self._transitions = {}
+        self._versions = {}
+
+    def classify(self, dpath):
+        """Return (ignored, public, multiarch) tuple for given directory.
+
+        :param dpath: normalized path (without trailing slash)
+        :returns: ignored - True if directory belongs to another
+            interpreter implementation; public - version (or True if
+            unversioned) if it's a public directory; multiarch - True if
+            it's a multiarch directory (or its subdirectory)
+        """
+        state = self._state(dpath)
+        public = state[2]
+        if public is not None and public is not True:
+            public = self._versions.get(public)
+            if public is None:
+                public = self._versions[state[2]] = Version(state[2])
+        return state[0], public, state[4]
+
+    def _state(self, dpath):
+        state = self._dirs.get(dpath)
+        if state is None:
+            head, name = dpath.rsplit('/', 1) if '/' in dpath else (None, dpath)
+            parent = None if head is None else self._state(head)
+            state = self._dirs[dpath] = self._next_state(parent, name)
+        return state
+
+    def _next_state(self, parent, name):
+        # state: (ignored, name belongs to other implementation,
+        #         public version (str) or True, number of matched components
+        #         of public dir's prefix, multiarch)
+        if parent is None:
+            # regular expressions expect a slash before matching component
+            return False, False, None, 0, False
+        key = (parent, name)
+        state = self._transitions.get(key)
+        if state is None:
+            ignored, other_impl, public, step, multiarch = parent
+            if public is None:
+                if step == 2:
+                    match = self._public_re.fullmatch(name)
+                    if match:
+                        public = match.group(1) if match.groups() else True
+                step = 1 if name == 'usr' else 2 if step == 1 and name == 'lib' else 0
+            state = self._transitions[key] = (
+                ignored or other_impl,
+                bool(self._other_impl_re.fullmatch(name)),
+                public, 0 if public is not None else step,
+                multiarch or bool(MULTIARCH_DIR_NAME_RE.fullmatch(name)))
+        return state
+
+
+def merge_scan_results(result, other):
+    """Merge partial Scan result into result."""
+    for key, value in other.items():
+        if isinstance(value, set):
+            result.setdefault(key, set()).update(value)
+        elif isinstance(value, dict):
+            for name, details in value.items():
+                merge_scan_results(result.setdefault(key, {}).setdefault(name, {}),
+                                   details)
+        else:
+            result[key] = result.get(key) or value
+
+
+# Scan instance used by a worker process (inherited via fork, only file jobs
+# are sent to workers)
+_worker_scan = None
+
+
+def _init_scan_worker(scan):
+    global _worker_scan
+    _worker_scan = scan
+    capture_logs()
+
+
+def _run_scan_job(job):
+    return _worker_scan._scan_job(job), captured_logs()
+
+
 class Scan:
     UNWANTED_DIRS = re.compile(r'.*/__pycache__(/.*)?$')
     UNWANTED_FILES = re.compile(r'.*\.py[co]$')
-
-    def __init__(self, interpreter, package, dpath=None, options=None):
+    # minimal number of files that makes scanning them in parallel worth it
+    PARALLEL_THRESHOLD = 1000
+
+    def __init__(self, interpreter, package, dpath=None, options=None, jobs=1,
+                 tree=None, manifest=None):
+        """Scan package's directory (and fix what can be fixed).
+
+        :param dpath: private directory (or a list of them) to scan instead
+            of the whole package, False to not check private directories
+        :param jobs: number of worker processes used to scan files in
+            public and private directories
+        :param tree: index of package's files
+        :type tree: TreeIndex
+        :param manifest: results of the previous run, files from directories
+            that didn't change since then are not scanned again
+        :type manifest: Manifest
+        """
         self.interpreter = interpreter
         self.impl = interpreter.impl
 
         self.package = package
 
         if not dpath:
-            self.proot = "debian/%s" % self.package
+            self.proots = ["debian/%s" % self.package]
         else:
-            dpath = dpath.strip('/')
-            self.proot = join('debian', self.package, dpath)
+            if isinstance(dpath, str):
+                dpath = [dpath]
+            dpath = [i.strip('/') for i in dpath]
+            self.proots = [join('debian', self.package, i) for i in dpath]
+        self.proot = self.proots[0]
         self.dpath = dpath
         del dpath
 
         self.options = options
-        self.result = {'requires.txt': set(),
-                       'egg-info': set(),
-                       'dist-info': set(),
-                       'nsp.txt': set(),
-                       'shebangs': set(),
-                       'public_vers': set(),
-                       'private_dirs': {},
-                       'compile': False,
-                       'ext_vers': set(),
-                       'ext_no_version': set()}
-
-        for root, dirs, file_names in os.walk(self.proot):
-            if interpreter.should_ignore(root):
+        self.jobs = jobs
+        self.result = self.new_result()
+        self.file_kinds = FileKinds()
+        self.tree = TreeIndex() if tree is None else tree
+        self.manifest = manifest
+        self.dirs = DirClassifier(self.impl)
+        self._private_dirs = [(join('debian', self.package, i), '/' + i)
+                              for i in self.private_dirs_to_check]
+
+        # files from these directories are scanned later (in parallel or not
+        # at all if they did not change since the previous run)
+        # (root, file_names, state of the directory, version)
+        file_jobs = []
+        dirs_to_remove = []
+        for root, dirs, file_names in chain.from_iterable(
+                self.tree.walk(i) for i in self.proots):
+            ignored, version, self.current_dir_is_multiarch = \
+                self.dirs.classify(root)
+            if ignored:
                 del dirs[:]
                 continue
 
             self.current_private_dir = self.current_pub_version = None
-            version = interpreter.parse_public_dir(root)
             if version:
                 self.current_dir_is_public = True
                 if version is True:
@@ -313,7 +595,7 @@ class Scan:
                     for name in dirs:
                         if name in ('test', 'tests') or name.startswith('.'):
                             log.debug('removing dist-packages/%s', name)
-                            rmtree(join(root, name))
+                            self.tree.rmtree(join(root, name))
                             dirs.remove(name)
             else:
                 self.current_private_dir = self.check_private_dir(root)
@@ -328,7 +610,7 @@ class Scan:
             for name in dirs:
                 dpath = join(root, name)
                 if self.is_unwanted_dir(dpath):
-                    rmtree(dpath)
+                    self.tree.rmtree(dpath)
                     dirs.remove(name)
                     continue
 
@@ -340,65 +622,164 @@ class Scan:
                 self.handle_egg_dir(root, file_names)
                 continue
 
-            # check files
-            for fn in sorted(file_names):
-                # sorted() to make sure .so files are handled before .so.foo
-                fpath = join(root, fn)
-
-                if self.is_unwanted_file(fpath):
-                    log.debug('removing unwanted: %s', fpath)
-                    os.remove(fpath)
-                    continue
-
-                if self.is_egg_file(fpath):
-                    self.handle_egg_file(fpath)
-                    continue
-
-                if not exists(fpath):
-                    # possibly removed while handling .so symlinks
-                    if islink(fpath) and '.so.' in split(fpath)[-1]:
-                        # dangling symlink to (now removed/renamed) .so file
-                        # which wasn't removed yet (see test203's quux.so.0)
-                        log.info('removing dangling symlink: %s', fpath)
-                        os.remove(fpath)
-                    continue
+            if jobs > 1 or manifest is not None:
+                file_jobs.append((root, sorted(file_names),
+                                  self.current_private_dir,
+                                  self.current_dir_is_public,
+                                  self.current_dir_is_multiarch,
+                                  self.current_pub_version, version))
+                if not dirs and not self.current_private_dir:
+                    dirs_to_remove.append(root)
+                continue
 
-                fext = splitext(fn)[-1][1:]
-                if fext == 'so':
-                    if not self.options.no_ext_rename:
-                        fpath = self.rename_ext(fpath, interpreter, version)
-                    ver = self.handle_ext(fpath)
-                    ver = ver or version
-                    if ver:
-                        self.current_result.setdefault('ext_vers', set()).add(ver)
-                    else:
-                        self.current_result.setdefault('ext_no_version', set()).add(fpath)
-
-                if self.current_private_dir:
-                    if exists(fpath) and fext != 'so':
-                        mode = os.stat(fpath)[ST_MODE]
-                        if mode & S_IXUSR or mode & S_IXGRP or mode & S_IXOTH:
-                            if (options.no_shebang_rewrite or
-                                fix_shebang(fpath, self.options.shebang)) and \
-                                    not self.options.ignore_shebangs:
-                                try:
-                                    res = Interpreter.from_file(fpath)
-                                except Exception as e:
-                                    log.debug('cannot parse shebang %s: %s', fpath, e)
-                                else:
-                                    self.current_result.setdefault('shebangs', set()).add(res)
-
-                if fext == 'py' and self.handle_public_module(fpath) is not False:
-                    self.current_result['compile'] = True
+            self.scan_files(root, file_names, version)
 
             if not dirs and not self.current_private_dir:
                 try:
-                    os.removedirs(root)
+                    self.tree.removedirs(root)
+                except OSError:
+                    pass
+
+        if file_jobs:
+            self.scan_dirs(file_jobs, jobs)
+            for root in dirs_to_remove:
+                try:
+                    self.tree.removedirs(root)
                 except OSError:
                     pass
 
         log.debug("package %s details = %s", package, self.result)
 
+    @staticmethod
+    def new_result():
+        return {'requires.txt': set(),
+                'egg-info': set(),
+                'dist-info': set(),
+                'nsp.txt': set(),
+                'shebangs': set(),
+                'public_vers': set(),
+                'private_dirs': {},
+                'compile': False,
+                'ext_vers': set(),
+                'ext_no_version': set()}
+
+    def scan_files(self, root, file_names, version):
+        """Check files from public or private directory."""
+        for fn in sorted(file_names):
+            # sorted() to make sure .so files are handled before .so.foo
+            fpath = join(root, fn)
+
+            if self.is_unwanted_file(fpath):
+                log.debug('removing unwanted: %s', fpath)
+                self.tree.remove(fpath)
+                continue
+
+            if self.is_egg_file(fpath):
+                self.handle_egg_file(fpath)
+                continue
+
+            try:
+                stat = os.stat(fpath)
+            except OSError:
+                # possibly removed while handling .so symlinks
+                if self.tree.islink(fpath) and '.so.' in split(fpath)[-1]:
+                    # dangling symlink to (now removed/renamed) .so file
+                    # which wasn't removed yet (see test203's quux.so.0)
+                    log.info('removing dangling symlink: %s', fpath)
+                    self.tree.remove(fpath)
+                continue
+
+            fext = splitext(fn)[-1][1:]
+            if fext == 'so':
+                if not self.options.no_ext_rename:
+                    multiarch = self.current_dir_is_multiarch or \
+                        bool(MULTIARCH_DIR_NAME_RE.fullmatch(fn))
+                    # renamed file keeps its inode, stat is still valid
+                    fpath = self.rename_ext(fpath, self.interpreter, version,
+                                            self.tree, multiarch,
+                                            self.options.detect_abi3,
+                                            self.file_kinds, stat)
+                ver = self.handle_ext(fpath, stat)
+                ver = ver or version
+                if ver:
+                    self.current_result.setdefault('ext_vers', set()).add(ver)
+                else:
+                    self.current_result.setdefault('ext_no_version', set()).add(fpath)
+            elif self.current_private_dir and \
+                    stat.st_mode & (S_IXUSR | S_IXGRP | S_IXOTH):
+                res = self.handle_script(fpath, stat)
+                if res:
+                    self.current_result.setdefault('shebangs', set()).add(res)
+
+            if fext == 'py' and self.handle_public_module(fpath) is not False:
+                self.current_result['compile'] = True
+
+    def scan_dirs(self, file_jobs, jobs):
+        """Scan files from given directories.
+
+        Results of directories that didn't change since the previous run
+        are taken from the manifest (it's safe to scan already fixed files
+        again, i.e. the result would be the same anyway).
+        """
+        if self.manifest is None:
+            self.scan_in_parallel(file_jobs, jobs)
+            return
+        todo = []
+        for job in file_jobs:
+            root = job[0]
+            result = self.manifest.get('dirs', root,
+                                       (canonical(job[2:]), dir_fingerprint(root)))
+            if result is None:
+                todo.append(job)
+            else:
+                log.debug('%s did not change since previous run', root)
+                merge_scan_results(self.result, result)
+        for job, result in zip(todo, self.scan_in_parallel(todo, jobs)):
+            root = job[0]
+            self.manifest.set('dirs', root,
+                              (canonical(job[2:]), dir_fingerprint(root)), result)
+
+    def scan_in_parallel(self, file_jobs, jobs):
+        """Invoke scan_files for given directories in worker processes.
+
+        Partial results (and log messages) are merged in the order
+        directories were found in, to keep the output reproducible.
+
+        :return: list of partial results
+        """
+        if jobs < 2 or sum(len(job[1]) for job in file_jobs) < self.PARALLEL_THRESHOLD:
+            results = [self._scan_job(job) for job in file_jobs]
+            for result in results:
+                merge_scan_results(self.result, result)
+            return results
+
+        log.debug('scanning %s using %d processes', ', '.join(self.proots), jobs)
+        chunksize = max(1, len(file_jobs) // (jobs * 4))
+        results = []
+        with ProcessPoolExecutor(jobs, mp_context=get_context('fork'),
+                                 initializer=_init_scan_worker,
+                                 initargs=(self,)) as executor:
+            for result, records in executor.map(_run_scan_job, file_jobs,
+                                                chunksize=chunksize):
+                for record in records:
+                    log.handle(record)
+                merge_scan_results(self.result, result)
+                results.append(result)
+        # files were renamed or removed in other processes
+        for job in file_jobs:
+            self.tree.forget(job[0])
+        return results
+
+    def _scan_job(self, job):
+        root, file_names, self.current_private_dir, self.current_dir_is_public,\
+            self.current_dir_is_multiarch, self.current_pub_version, version = job
+        result, self.result = self.result, self.new_result()
+        try:
+            self.scan_files(root, file_names, version)
+            return self.result
+        finally:
+            self.result = result
+
     @property
     def current_result(self):
         if self.current_private_dir:
@@ -419,8 +800,8 @@ class Scan:
     @property
     def private_dirs_to_check(self):
         if self.dpath:
-            # scan private directory *only*
-            return [self.dpath]
+            # scan private directories *only*
+            return list(self.dpath)
 
         if self.dpath is False:
             result = []
@@ -439,54 +820,82 @@ class Scan:
 
     def check_private_dir(self, dpath):
         """Return private dir's root if it's a private dir."""
-        for i in self.private_dirs_to_check:
-            if dpath.startswith(join('debian', self.package, i)):
-                return '/' + i
+        for prefix, private_dir in self._private_dirs:
+            if dpath == prefix or dpath.startswith(prefix + '/'):
+                return private_dir
 
     @staticmethod
-    def rename_ext(fpath, interpreter, current_pub_version=None):
+    def rename_ext(fpath, interpreter, current_pub_version=None, tree=None,
+                   multiarch=None, detect_abi3=False, file_kinds=None, stat=None):
         """Add multiarch triplet, etc. Return new name.
 
         This method is invoked for all .so files in public or private directories.
+
+        :type tree: TreeIndex
+        :param multiarch: True if fpath is in a multiarch directory
+            (checked with MULTIARCH_DIR_TPL if not known)
+        :param detect_abi3: tag extensions that use Stable ABI symbols only
+            (available in the oldest supported version) with .abi3 (there's
+            no way to tell if they were built with Py_LIMITED_API, though)
+        :param file_kinds: cache of files' kinds
+        :type file_kinds: FileKinds
+        :param stat: os.stat() result of this file, if already available
         """
+        if tree is None:
+            tree = TreeIndex()
         # current_pub_version - version parsed from dist-packages (True if unversioned)
         # i.e. if it's not None - it's a public dist-packages directory
 
         path, fname = fpath.rsplit('/', 1)
-        if current_pub_version is not None and islink(fpath):
+        if current_pub_version is not None and tree.islink(fpath):
             # replace symlinks with extensions in dist-packages directory
             dstfpath = fpath
             links = set()
-            while islink(dstfpath):
+            while tree.islink(dstfpath):
                 links.add(dstfpath)
                 dstfpath = join(path, os.readlink(dstfpath))
-            if exists(dstfpath) and '.so.' in split(dstfpath)[-1]:
+            if tree.exists(dstfpath) and '.so.' in split(dstfpath)[-1]:
                 # rename .so.$FOO symlinks, remove other ones
                 for lpath in links:
                     log.info('removing symlink: %s', lpath)
-                    os.remove(lpath)
+                    tree.remove(lpath)
                 log.info('renaming %s to %s', dstfpath, fname)
-                os.rename(dstfpath, fpath)
+                tree.rename(dstfpath, fpath)
 
-        if MULTIARCH_DIR_TPL.match(fpath):
+        if multiarch is None:
+            multiarch = MULTIARCH_DIR_TPL.match(fpath)
+        if multiarch:
             # ignore /lib/i386-linux-gnu/, /usr/lib/x86_64-kfreebsd-gnu/, etc.
             return fpath
 
-        new_fn = interpreter.check_extname(fname, current_pub_version)
+        stableabi = False
+        if detect_abi3 and interpreter.impl == 'cpython3' and not tree.islink(fpath):
+            if file_kinds is None:
+                file_kinds = FileKinds()
+            info = file_kinds.elf(fpath, stat)
+            # .abi3.so files are loaded by all supported versions
+            stableabi = info is not None and uses_stable_abi(
+                fpath, info, min(supported(interpreter.impl)))
+        if stableabi:
+            log.debug('%s uses Stable ABI symbols only', fpath)
+        new_fn = interpreter.check_extname(fname, current_pub_version, stableabi)
         if new_fn:
             # TODO: what about symlinks pointing to this file
             new_fpath = join(path, new_fn)
-            if exists(new_fpath):
+            if tree.exists(new_fpath):
                 log.warn('destination file exist, '
                          'cannot rename %s to %s', fname, new_fn)
             else:
                 log.info('renaming %s to %s', fname, new_fn)
-                os.rename(fpath, new_fpath)
+                tree.rename(fpath, new_fpath)
             return new_fpath
         return fpath
 
-    def handle_ext(self, fpath):
-        """Handle .so file, return its version if detected."""
+    def handle_ext(self, fpath, stat=None):
+        """Handle .so file, return its version if detected.
+
+        :param stat: os.stat() result of this file, if already available
+        """
 
     def handle_public_module(self, fpath):
         pass
@@ -504,15 +913,45 @@ class Scan:
     def handle_bin_dir(self, dpath, file_names):
         if self.options.no_shebang_rewrite or self.options.ignore_shebangs:
             return
+        rewrites = []
         for fn in file_names:
-            fpath = join(dpath, fn)
-            if fix_shebang(fpath, self.options.shebang):
-                try:
-                    res = Interpreter.from_file(fpath)
-                except Exception as e:
-                    log.debug('cannot parse shebang %s: %s', fpath, e)
-                else:
-                    self.result['shebangs'].add(res)
+            res = self.handle_script(join(dpath, fn), rewrites=rewrites)
+            if res:
+                self.result['shebangs'].add(res)
+        rewrite_shebangs(rewrites, self.jobs)
+
+    def handle_script(self, fpath, stat=None, rewrites=None):
+        """Normalize script's shebang, return its interpreter.
+
+        :param stat: os.stat() result of this file, if already available
+        :param rewrites: if given, (file path, new shebang command) pair is
+            added to this list instead of rewriting the file right away
+        :returns: None if it's not a Python script or shebangs are ignored
+        """
+        if self.options.no_shebang_rewrite and self.options.ignore_shebangs:
+            return
+        try:
+            kind, _, head = self.file_kinds.get(fpath, stat)
+        except OSError as e:
+            log.debug('cannot read %s: %s', fpath, e)
+            return
+        if kind != 'script':
+            return
+        try:
+            interpreter = Interpreter.from_shebang(head)
+            if not self.options.no_shebang_rewrite:
+                replacement = shebang_replacement(interpreter, self.options.shebang)
+                if replacement:
+                    if rewrites is not None:
+                        rewrites.append((fpath, replacement))
+                    elif not fix_shebang(fpath, replacement, interpreter):
+                        return
+                    interpreter = Interpreter.from_shebang('#! %s' % replacement)
+        except ValueError as e:
+            log.debug('cannot parse shebang %s: %s', fpath, e)
+            return
+        if not self.options.ignore_shebangs:
+            return interpreter
 
     def is_egg_dir(self, dname):
         """Check if given directory contains egg-info."""
@@ -521,18 +960,18 @@ class Scan:
     def handle_egg_dir(self, dpath, file_names):
         path, dname = dpath.rsplit('/', 1)
         if self.is_dbg_package and self.options.clean_dbg_pkg:
-            rmtree(dpath)
+            self.tree.rmtree(dpath)
             return
 
         clean_name = clean_egg_name(dname)
         if clean_name != dname:
-            if exists(join(path, clean_name)):
+            if self.tree.exists(join(path, clean_name)):
                 log.info('removing %s (%s is already available)', dname, clean_name)
-                rmtree(dpath)
+                self.tree.rmtree(dpath)
                 return
             else:
                 log.info('renaming %s to %s', dname, clean_name)
-                os.rename(dpath, join(path, clean_name))
+                self.tree.rename(dpath, join(path, clean_name))
                 dname = clean_name
                 dpath = join(path, dname)
         if file_names:
@@ -541,7 +980,7 @@ class Scan:
             if 'namespace_packages.txt' in file_names:
                 self.result['nsp.txt'].add(join(dpath, 'namespace_packages.txt'))
             if 'SOURCES.txt' in file_names:
-                os.remove(join(dpath, 'SOURCES.txt'))
+                self.tree.remove(join(dpath, 'SOURCES.txt'))
                 file_names.remove('SOURCES.txt')
 
     def is_egg_file(self, fpath):
@@ -552,13 +991,13 @@ class Scan:
         root, name = fpath.rsplit('/', 1)
         clean_name = clean_egg_name(name)
         if clean_name != name:
-            if exists(join(root, clean_name)):
+            if self.tree.exists(join(root, clean_name)):
                 log.info('removing %s (%s is already available)',
                          name, clean_name)
-                os.remove(fpath)
+                self.tree.remove(fpath)
             else:
                 log.info('renaming %s to %s', name, clean_name)
-                os.rename(fpath, join(root, clean_name))
+                self.tree.rename(fpath, join(root, clean_name))
         self.result['egg-info'].add(join(root, clean_name))
 
     def is_dist_dir(self, dname):
@@ -568,7 +1007,7 @@ class Scan:
     def handle_dist_dir(self, dpath, file_names):
         path, dname = dpath.rsplit('/', 1)
         if self.is_dbg_package and self.options.clean_dbg_pkg:
-            rmtree(dpath)
+            self.tree.rmtree(dpath)
             return
 
         if file_names:
@@ -579,9 +1018,9 @@ class Scan:
         if self.is_dbg_package and self.options.clean_dbg_pkg:
             # remove empty directories in -dbg packages
             proot = self.proot + '/usr/lib'
-            for root, dirs, file_names in os.walk(proot, topdown=False):
+            for root, dirs, file_names in self.tree.walk(proot, topdown=False):
                 if '-packages/' in root and not file_names:
                     try:
-                        os.removedirs(root)
+                        self.tree.removedirs(root)
                     except Exception:
                         pass
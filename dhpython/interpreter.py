@@ -18,10 +18,16 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+import ast
+import json
 import logging
 import os
 import re
-from os.path import exists, join, split
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
+from os.path import exists, expanduser, isdir, islink, join, split
+from tempfile import mkstemp
 from dhpython import INTERPRETER_DIR_TPLS, PUBLIC_DIR_RE, OLD_SITE_DIRS
 
 SHEBANG_RE = re.compile(r'''
@@ -55,6 +61,78 @@ EXTFILE_RE = re.compile(r'''
     (?P<debug>_d)?
     \.so$''', re.VERBOSE)
 log = logging.getLogger('dhpython')
+# prints all details used by Interpreter methods as JSON
+# (it has to work with all Python versions, including 2.X)
+PROBE_SCRIPT = """
+import binascii, json, sys
+try:
+    import sysconfig as s
+except ImportError:
+    from distutils import sysconfig as s
+names = ("SOABI", "MULTIARCH", "INCLUDEPY", "LIBPL", "LDLIBRARY", "EXT_SUFFIX")
+result = dict(zip(names, s.get_config_vars(*names)))
+try:
+    from importlib.util import MAGIC_NUMBER as magic
+    tag = sys.implementation.cache_tag
+except (ImportError, AttributeError):
+    import imp
+    magic = imp.get_magic()
+    tag = imp.get_tag() if hasattr(imp, "get_tag") else None
+result["MAGIC_NUMBER"] = binascii.hexlify(magic).decode("ascii")
+result["CACHE_TAG"] = tag
+print(json.dumps(result))
+"""
+
+# environment variables that can change PROBE_SCRIPT's output
+PROBE_ENV = ('DEB_HOST_MULTIARCH', '_PYTHON_SYSCONFIGDATA_NAME')
+# directory with _sysconfigdata files, formatted with interpreter's version
+SYSCONFIGDATA_DIR_TPL = '/usr/lib/python{}'
+# serializes updates of the cache file made by probe_versions' threads
+_probe_cache_lock = threading.Lock()
+
+
+def probe_cache_path():
+    """Return path to the file with cached details of interpreters.
+
+    .pybuild directory is used if it exists (i.e. in pybuild's builds,
+    it's removed by dh_clean), user's cache directory otherwise.
+    """
+    if isdir('.pybuild'):
+        return '.pybuild/interpreters.json'
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or expanduser('~/.cache')
+    return join(cache_dir, 'dh-python', 'interpreters.json')
+
+
+def load_probe_cache():
+    fpath = probe_cache_path()
+    if not exists(fpath):
+        return {}
+    try:
+        with open(fpath, encoding='utf-8') as fp:
+            return json.load(fp)
+    except Exception as err:
+        log.debug('cannot read %s: %s', fpath, err)
+        return {}
+
+
+def save_probe_cache(key, entry):
+    """Add (or replace a stale) entry to the file with cached details."""
+    fpath = probe_cache_path()
+    tmp_fpath = None
+    try:
+        with _probe_cache_lock:
+            data = load_probe_cache()
+            data[key] = entry
+            os.makedirs(split(fpath)[0], exist_ok=True)
+            # unique name, other processes can write it at the same time
+            fd, tmp_fpath = mkstemp(dir=split(fpath)[0], suffix='.new')
+            with open(fd, 'w', encoding='utf-8') as fp:
+                json.dump(data, fp, indent=1, sort_keys=True)
+            os.replace(tmp_fpath, fpath)
+    except Exception as err:
+        log.debug('cannot write %s: %s', fpath, err)
+        if tmp_fpath and exists(tmp_fpath):
+            os.remove(tmp_fpath)
 
 
 class Interpreter:
@@ -197,13 +275,24 @@ class Interpreter:
     @classmethod
     def from_file(cls, fpath):
         """Read file's shebang and parse it."""
-        interpreter = Interpreter()
         with open(fpath, 'rb') as fp:
             data = fp.read(96)
+        return cls.from_shebang(data)
+
+    @classmethod
+    def from_shebang(cls, data):
+        """Parse shebang (only first line of given bytes or text is checked).
+
+        >>> Interpreter.from_shebang(b'#! /usr/bin/python3.9 -E\\nimport os')
+        /usr/bin/python3.9 -E
+        """
+        interpreter = Interpreter()
+        if isinstance(data, bytes):
             if b"\0" in data:
                 raise ValueError('cannot parse binary file')
+            data = str(data, 'utf-8')
         # make sure only first line is checkeed
-        data = str(data, 'utf-8').split('\n')[0]
+        data = data.split('\n')[0]
         if not data.startswith('#!'):
             raise ValueError("doesn't look like a shebang: %s" % data)
 
@@ -326,8 +415,7 @@ class Interpreter:
         version = Version(version or self.version)
         if self.impl == 'cpython2':
             return ''
-        result = self._execute('import imp; print(imp.get_magic())', version)
-        return eval(result)
+        return bytes.fromhex(self._probe(version, static=False)['MAGIC_NUMBER'])
 
     def magic_tag(self, version=None):
         """Return Python magic tag (used in __pycache__ dir to tag files).
@@ -339,7 +427,7 @@ class Interpreter:
         version = Version(version or self.version)
         if self.impl.startswith('cpython') and version << Version('3.2'):
             return ''
-        return self._execute('import imp; print(imp.get_tag())', version)
+        return self._probe(version)['CACHE_TAG']
 
     def multiarch(self, version=None):
         """Return multiarch tag."""
@@ -440,8 +528,12 @@ class Interpreter:
             return join(libpl, ldlibrary)
         raise Exception('cannot find library file for {}'.format(self))
 
-    def check_extname(self, fname, version=None):
-        """Return extension file name if file can be renamed."""
+    def check_extname(self, fname, version=None, stableabi=False):
+        """Return extension file name if file can be renamed.
+
+        :param stableabi: True if extension uses the Stable ABI (untagged
+            extensions get .abi3 tag instead of SOABI one)
+        """
         if not version and not self.version:
             return
 
@@ -472,6 +564,15 @@ class Interpreter:
             # already tagged, nothing we can do here
             return
 
+        result = info['name']
+        if result.endswith('module') and result != 'module' and (
+           self.impl == 'cpython3' and version >> '3.2' or
+           self.impl == 'cpython2' and version == '2.7'):
+            result = result[:-6]
+
+        if stableabi and not info['soabi'] and not self.debug and self.stableabi(version):
+            return join(fdir, '{}.{}.so'.format(result, self.stableabi(version)))
+
         try:
             soabi, multiarch = self._get_config(version)[:2]
         except Exception:
@@ -484,12 +585,6 @@ class Interpreter:
         tmp_soabi = info['soabi'] or soabi
         tmp_multiarch = info['multiarch'] or multiarch
 
-        result = info['name']
-        if result.endswith('module') and result != 'module' and (
-           self.impl == 'cpython3' and version >> '3.2' or
-           self.impl == 'cpython2' and version == '2.7'):
-            result = result[:-6]
-
         if tmp_soabi:
             result = "{}.{}".format(result, tmp_soabi)
             if tmp_multiarch and not (self.impl == 'cpython3' and version << '3.3') and tmp_multiarch not in soabi:
@@ -524,19 +619,10 @@ class Interpreter:
         return result
 
     def _get_config(self, version=None):
-        version = Version(version or self.version)
-        # sysconfig module is available since Python 3.2
-        # (also backported to Python 2.7)
-        if self.impl == 'pypy' or self.impl.startswith('cpython') and (
-                version >> '2.6' and version << '3'
-                or version >> '3.1' or version == '3'):
-            cmd = 'import sysconfig as s;'
-        else:
-            cmd = 'from distutils import sysconfig as s;'
-        cmd += 'print("__SEP__".join(i or "" ' \
-               'for i in s.get_config_vars('\
-               '"SOABI", "MULTIARCH", "INCLUDEPY", "LIBPL", "LDLIBRARY")))'
-        conf_vars = self._execute(cmd, version).split('__SEP__')
+        """Return SOABI, MULTIARCH, INCLUDEPY, LIBPL and LDLIBRARY values."""
+        config = self._probe(version)
+        conf_vars = [config[i] or '' for i in
+                     ('SOABI', 'MULTIARCH', 'INCLUDEPY', 'LIBPL', 'LDLIBRARY')]
         if conf_vars[1] in conf_vars[0]:
             # Python >= 3.5 includes MILTIARCH in SOABI
             conf_vars[0] = conf_vars[0].replace("-%s" % conf_vars[1], '')
@@ -546,31 +632,120 @@ class Interpreter:
             pass
         return conf_vars
 
-    def _execute(self, command, version=None, cache=True):
+    def _probe(self, version=None, static=True):
+        """Return interpreter's details (see PROBE_SCRIPT).
+
+        Interpreter is invoked only once, its details are cached (also
+        on disk, see probe_cache_path).
+
+        :param static: read details from interpreter's _sysconfigdata file
+            instead of invoking it, if possible (MAGIC_NUMBER is None then)
+        """
         version = Version(version or self.version)
         exe = "{}{}".format(self.path, self._vstr(version))
-        command = "{} -c '{}'".format(exe, command.replace("'", "\'"))
-        if cache and command in self.__class__._cache:
-            return self.__class__._cache[command]
-        if not exists(exe):
+        env = [os.environ.get(i) for i in PROBE_ENV]
+        cache = self.__class__._cache
+        cache_key = ('probe', exe) + tuple(env)
+        static_cache_key = ('sysconfigdata', exe) + tuple(env)
+        if cache_key in cache:
+            return cache[cache_key]
+        if static and static_cache_key in cache:
+            return cache[static_cache_key]
+        # the interpreter doesn't have to be installed for this one
+        result = self._sysconfigdata(version) if static else None
+        if result is not None:
+            cache[static_cache_key] = result
+            return result
+        try:
+            stat = os.stat(exe)
+        except FileNotFoundError:
             raise Exception("cannot execute command due to missing "
                             "interpreter: %s" % exe)
 
-        output = execute(command)
-        if output['returncode'] != 0:
-            log.debug(output['stderr'])
-            raise Exception('{} failed with status code {}'.format(command, output['returncode']))
+        # interpreter's inode changes on each upgrade
+        disk_key = json.dumps([exe] + env)
+        disk_stat = [stat.st_ino, stat.st_mtime_ns]
+        entry = load_probe_cache().get(disk_key)
+        if entry and entry.get('stat') == disk_stat:
+            result = entry['result']
+        else:
+            output = execute([exe, '-c', PROBE_SCRIPT], shell=False)
+            if output['returncode'] != 0:
+                log.debug(output['stderr'])
+                raise Exception('{} failed with status code {}'.format(exe, output['returncode']))
+            result = json.loads(output['stdout'])
+            save_probe_cache(disk_key, {'stat': disk_stat, 'result': result})
+
+        cache[cache_key] = result
+        return result
 
-        result = output['stdout'].splitlines()
+    def _sysconfigdata(self, version):
+        """Return details (like PROBE_SCRIPT) read from _sysconfigdata file.
 
-        if len(result) == 1:
-            result = result[0]
+        The file is parsed, not executed, so it works for interpreters
+        that cannot be invoked (f.e. in cross builds) as well.
+        None is returned if the file cannot be found.
+        """
+        if self.impl != 'cpython3' or version.minor is None or version << '3.6':
+            return
+        dpath = SYSCONFIGDATA_DIR_TPL.format(version)
+        name = os.environ.get('_PYTHON_SYSCONFIGDATA_NAME')
+        multiarch = os.environ.get('DEB_HOST_MULTIARCH')
+        abiflags = 'd' if self.debug else ''
+        if version << '3.8':
+            abiflags += 'm'
+        if name:
+            fpaths = [join(dpath, name + '.py')]
+        elif multiarch:
+            fpaths = [join(dpath, '_sysconfigdata_{}_{}.py'.format(abiflags, multiarch))]
+        else:
+            # files for other architectures can be installed as well,
+            # symlinks point to the same files but with platform in the name
+            fpaths = [i for i in glob(join(dpath, '_sysconfigdata_{}_*.py'.format(abiflags)))
+                      if not islink(i)]
+        if len(fpaths) != 1 or not exists(fpaths[0]):
+            return
+        try:
+            with open(fpaths[0], 'rb') as fp:
+                module = ast.parse(fp.read(), fpaths[0])
+            for node in module.body:
+                if isinstance(node, ast.Assign) and \
+                        any(getattr(i, 'id', None) == 'build_time_vars' for i in node.targets):
+                    config = ast.literal_eval(node.value)
+                    break
+            else:
+                return
+        except (OSError, SyntaxError, ValueError) as err:
+            log.debug('cannot parse %s: %s', fpaths[0], err)
+            return
+        result = {i: config.get(i) for i in
+                  ('SOABI', 'MULTIARCH', 'INCLUDEPY', 'LIBPL', 'LDLIBRARY', 'EXT_SUFFIX')}
+        result['CACHE_TAG'] = 'cpython-{}{}'.format(version.major, version.minor)
+        result['MAGIC_NUMBER'] = None
+        return result
 
-        if cache:
-            self.__class__._cache[command] = result
+    def probe_versions(self, versions, jobs=None):
+        """Invoke interpreters for given versions at the same time.
 
-        return result
+        Their details are cached, so later calls (f.e. while renaming
+        extensions) do not have to wait for them one by one.
+
+        :param jobs: max. number of interpreters invoked at the same time
+        """
+        def probe(version):
+            try:
+                self._probe(version)
+            except Exception as err:
+                log.debug('cannot probe %s interpreter: %s', version, err)
+
+        versions = list(versions)
+        if len(versions) < 2:
+            for version in versions:
+                probe(version)
+            return
+        with ThreadPoolExecutor(min(parallel_jobs(jobs), len(versions))) as executor:
+            list(executor.map(probe, versions))
 
 # due to circular imports issue
-from dhpython.tools import execute
+from dhpython.tools import execute, parallel_jobs
 from dhpython.version import Version, default
@@ -0,0 +1,132 @@
+# Copyright © 2026 dh-python developers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import logging
+import os
+import pickle
+from os.path import join, split
+
+log = logging.getLogger('dhpython')
+
+
+def canonical(value):
+    """Return representation of value that doesn't depend on sets' order.
+
+    >>> canonical({'b': {2, 1}, 'a': None})
+    (("'a'", 'None'), ("'b'", ('1', '2')))
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((repr(k), canonical(v)) for k, v in value.items()))
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted((canonical(i) for i in value), key=repr))
+    if isinstance(value, (list, tuple)):
+        return tuple(canonical(i) for i in value)
+    return repr(value)
+
+
+def fingerprint(paths):
+    """Return (path, inode, mtime, size) tuples for given files.
+
+    Missing files are included as well (inode, mtime and size are None).
+    """
+    result = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            result.append((path, None, None, None))
+        else:
+            result.append((path, stat.st_ino, stat.st_mtime_ns, stat.st_size))
+    return tuple(result)
+
+
+def dir_fingerprint(dpath):
+    """Return (name, inode, mtime, size) tuples for files in given directory.
+
+    Subdirectories are not included, symlinks are not followed.
+    """
+    result = []
+    try:
+        with os.scandir(dpath) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        continue
+                except OSError:
+                    pass
+                stat = entry.stat(follow_symlinks=False)
+                result.append((entry.name, stat.st_ino, stat.st_mtime_ns,
+                               stat.st_size))
+    except FileNotFoundError:
+        return None
+    return tuple(sorted(result))
+
+
+class Manifest:
+    """Details of files processed by the previous run.
+
+    Entries are grouped in sections and stored together with a key (f.e.
+    file details from :func:`fingerprint`) which has to match the one
+    used in the next run. The whole manifest is ignored if it was saved
+    with a different key (f.e. tool's version or its options).
+    """
+    FORMAT = 1
+
+    def __init__(self, fpath, key=None):
+        self.fpath = fpath
+        self.key = (self.FORMAT, key)
+        self.previous = {}
+        self.current = {}
+        try:
+            with open(fpath, 'rb') as fp:
+                key, previous = pickle.load(fp)
+        except FileNotFoundError:
+            return
+        except Exception as err:
+            log.debug('ignoring invalid manifest %s: %s', fpath, err)
+            return
+        if key == self.key:
+            self.previous = previous
+        else:
+            log.debug('ignoring manifest %s (saved with different options)', fpath)
+
+    def get(self, section, name, key):
+        """Return value saved by the previous run (if its key matches).
+
+        Matching entries are saved again by :meth:`save`.
+        """
+        entry = self.previous.get(section, {}).get(name)
+        if entry is not None and entry[0] == key:
+            self.current.setdefault(section, {})[name] = entry
+            return entry[1]
+
+    def set(self, section, name, key, value):
+        self.current.setdefault(section, {})[name] = (key, value)
+
+    def save(self):
+        """Write entries set or reused in this run (atomically)."""
+        dpath, fname = split(self.fpath)
+        if dpath:
+            os.makedirs(dpath, exist_ok=True)
+        tmp_fpath = join(dpath, '.%s.tmp' % fname)
+        with open(tmp_fpath, 'wb') as fp:
+            pickle.dump((self.key, self.current), fp)
+        os.replace(tmp_fpath, self.fpath)
@@ -21,11 +21,15 @@
 
 import email
 import logging
+import pickle
 import platform
 import os
 import re
+import struct
+from bisect import bisect_left
 from functools import partial
-from os.path import exists, isdir, join
+from mmap import mmap, ACCESS_READ
+from os.path import exists, expanduser, isdir, join, split
 from subprocess import PIPE, Popen
 
 if __name__ == '__main__':
@@ -36,7 +40,7 @@ from dhpython import PKG_PREFIX_MAP, PUBLIC_DIR_RE,\
     PYDIST_DIRS, PYDIST_OVERRIDES_FNAMES, PYDIST_DPKG_SEARCH_TPLS
 from dhpython.markers import ComplexEnvironmentMarker, parse_environment_marker
 from dhpython.tools import memoize
-from dhpython.version import get_requested_versions, Version
+from dhpython.version import get_requested_versions, supported, Version
 
 log = logging.getLogger('dhpython')
 
@@ -101,6 +105,9 @@ REQ_SECTIONS_RE = re.compile(r'''
     \s*
     $
     ''', re.VERBOSE)
+# bump it if format of parsed entries changes
+INDEX_FORMAT = 1
+INDEX_HEADER = struct.Struct('<Q')  # size of pickled names and offsets
 DEB_VERS_OPS = {
     '==': '=',
     '<':  '<<',
@@ -123,12 +130,10 @@ def validate(fpath):
     return True
 
 
-@memoize
-def load(impl):
-    """Load information about installed Python distributions.
+def pydist_files(impl):
+    """Return pydist files with information about Python distributions.
 
-    :param impl: interpreter implementation, f.e. cpython2, cpython3, pypy
-    :type impl: str
+    Files are listed in the order of precedence.
     """
     fname = PYDIST_OVERRIDES_FNAMES.get(impl)
     if exists(fname):
@@ -144,7 +149,123 @@ def load(impl):
     fbname = join(fbdir, '{}_fallback'.format(impl))
     if exists(fbname):  # fall back generated at dh-python build time
         to_check.append(fbname)  # last one!
+    return to_check
+
+
+def index_path(impl):
+    """Return path to the compiled index of pydist files.
+
+    Like interpreters' details, it's kept in .pybuild directory if it
+    exists, in user's cache directory otherwise.
+    """
+    fname = 'pydist_{}.index'.format(impl)
+    if isdir('.pybuild'):
+        return join('.pybuild', fname)
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or expanduser('~/.cache')
+    return join(cache_dir, 'dh-python', fname)
+
+
+class PyDistIndex:
+    """Read-only mapping of normalized distribution names to pydist entries.
+
+    Index file starts with a pickled header (sorted names and offsets of
+    their entries), entries of each name are pickled separately and
+    unpickled only when requested.
+    """
+
+    def __init__(self, fpath, key):
+        """:raise ValueError: if index is not valid or not built for key"""
+        with open(fpath, 'rb') as fp:
+            self._data = mmap(fp.fileno(), 0, access=ACCESS_READ)
+        try:
+            size, = INDEX_HEADER.unpack_from(self._data)
+            start = INDEX_HEADER.size
+            header = pickle.loads(self._data[start:start + size])
+        except Exception as err:
+            raise ValueError('invalid index: {}'.format(err))
+        if not isinstance(header, dict) or header.get('key') != key:
+            raise ValueError('index is outdated')
+        self._names = header['names']
+        self._offsets = header['offsets']
+        self._start = start + size
+        self._cache = {}
+
+    @staticmethod
+    def write(fpath, key, data):
+        """Save data generated by parse_pydist() (atomically)."""
+        names = sorted(data)
+        blobs = [pickle.dumps(data[name]) for name in names]
+        offsets = [0]
+        for blob in blobs:
+            offsets.append(offsets[-1] + len(blob))
+        header = pickle.dumps({'key': key, 'names': names, 'offsets': offsets})
+        tmp_fpath = '{}.{}.new'.format(fpath, os.getpid())
+        os.makedirs(split(fpath)[0] or '.', exist_ok=True)
+        with open(tmp_fpath, 'wb') as fp:
+            fp.write(INDEX_HEADER.pack(len(header)))
+            fp.write(header)
+            for blob in blobs:
+                fp.write(blob)
+        os.replace(tmp_fpath, fpath)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        pos = bisect_left(self._names, name)
+        return pos < len(self._names) and self._names[pos] == name
+
+    def get(self, name, default=None):
+        if name in self._cache:
+            return self._cache[name]
+        pos = bisect_left(self._names, name)
+        if pos == len(self._names) or self._names[pos] != name:
+            return default
+        start = self._start + self._offsets[pos]
+        end = self._start + self._offsets[pos + 1]
+        result = self._cache[name] = pickle.loads(self._data[start:end])
+        return result
+
+
+@memoize
+def load(impl):
+    """Load information about installed Python distributions.
+
+    Parsed pydist files are saved in an index (see index_path), it's
+    used instead of parsing them again until one of them changes.
+
+    :param impl: interpreter implementation, f.e. cpython2, cpython3, pypy
+    :type impl: str
+    :rtype: PyDistIndex or dict
+    """
+    to_check = pydist_files(impl)
+    # entries list supported versions they apply to
+    key = [INDEX_FORMAT, impl, sorted(str(i) for i in supported(impl))]
+    for fpath in to_check:
+        fstat = os.stat(fpath)
+        key.append((fpath, fstat.st_mtime_ns, fstat.st_size))
+
+    fpath = index_path(impl)
+    if exists(fpath):
+        try:
+            return PyDistIndex(fpath, key)
+        except Exception as err:
+            log.debug('cannot use %s: %s', fpath, err)
+
+    result = parse_pydist(impl, to_check)
+    try:
+        PyDistIndex.write(fpath, key, result)
+    except Exception as err:
+        log.debug('cannot write %s: %s', fpath, err)
+    return result
+
 
+def parse_pydist(impl, to_check):
+    """Parse pydist files.
+
+    :param to_check: files to parse (in the order of precedence)
+    :return: normalized distribution name → list of entries
+    """
     result = {}
     for fpath in to_check:
         with open(fpath, encoding='utf-8') as fp:
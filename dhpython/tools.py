@@ -19,20 +19,37 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+import errno
+import fcntl
+import hashlib
 import logging
 import os
 import re
-import locale
+import sys
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, suppress
 from datetime import datetime
+from fnmatch import fnmatch
 from glob import glob
 from pickle import dumps
-from shutil import rmtree
+from shutil import copyfileobj, copystat, rmtree
+from stat import S_IMODE
 from os.path import exists, getsize, isdir, islink, join, split
-from subprocess import Popen, PIPE
+from subprocess import Popen, PIPE, STDOUT
+from threading import Lock
+from time import monotonic
+from dhpython.elf import read_elf
 
 log = logging.getLogger('dhpython')
 EGGnPTH_RE = re.compile(r'(.*?)(-py\d\.\d(?:-[^.]*)?)?(\.egg-info|\.pth)$')
-SHAREDLIB_RE = re.compile(r'NEEDED.*libpython(\d\.\d)')
+SHAREDLIB_RE = re.compile(r'libpython(\d\.\d+)')
+# serializes writes of prefixed output from commands invoked in parallel
+_output_lock = Lock()
+# ioctl(2) request that makes a file share data blocks with another one
+FICLONE = 0x40049409
+# devices that do not support FICLONE, no need to try it again there
+_noreflink_devices = set()
 
 
 def relpath(target, link):
@@ -91,54 +108,267 @@ def move_matching_files(src, dst, pattern, sub=None, repl=''):
                 os.renames(spath, dpath)
 
 
-def fix_shebang(fpath, replacement=None):
-    """Normalize file's shebang.
+def transfer_file(src, dst, move=False, link=True):
+    """Make src file available as dst using the cheapest available method.
 
-    :param replacement: new shebang command (path to interpreter and options)
+    Methods are tried in this order: rename (if `move` is True), reflink,
+    hard link (if `link` is True) and copy (via copy_file_range if possible).
+    Existing dst file is replaced, metadata is preserved.
+
+    :param move: src file is not needed anymore
+    :param link: src and dst can share inode (do not use it if one of them
+        is going to be modified in place)
+    :return: name of the method that was used
+    """
+    if os.path.lexists(dst):
+        os.remove(dst)
+    if move:
+        try:
+            os.rename(src, dst)
+            return 'rename'
+        except OSError:
+            pass
+
+    device = os.stat(src).st_dev
+    if device not in _noreflink_devices:
+        try:
+            with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError as err:
+            if err.errno != errno.EXDEV:
+                _noreflink_devices.add(device)
+            # dst is not created if open() failed
+            with suppress(FileNotFoundError):
+                os.remove(dst)
+        else:
+            copystat(src, dst)
+            return 'reflink'
+
+    if link:
+        try:
+            os.link(src, dst)
+            return 'link'
+        except OSError:
+            pass
+
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        copy_data(fsrc, fdst)
+    copystat(src, dst)
+    return 'copy'
+
+
+def copy_data(fsrc, fdst, offset=0):
+    """Append fsrc's content (starting at given offset) to fdst.
+
+    copy_file_range is used if possible (in-kernel copy that can share data
+    blocks on some file systems), file's position in fsrc is not relevant.
     """
+    fdst.flush()
+    start = fdst.tell()
+    pos = offset
     try:
-        interpreter = Interpreter.from_file(fpath)
-    except Exception as err:
-        log.debug('fix_shebang (%s): %s', fpath, err)
+        while True:
+            copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(),
+                                        1 << 30, pos)
+            if not copied:
+                break
+            pos += copied
+    except (AttributeError, OSError):
+        fsrc.seek(offset)
+        fdst.seek(start)
+        fdst.truncate()
+        copyfileobj(fsrc, fdst)
+
+
+def transfer_tree(src, dst, move=False, link=True):
+    """Make src directory's content available in dst (see transfer_file).
+
+    Symlinks are followed (like in shutil.copytree), dst can exist already.
+
+    :return: number of files transferred using each method
+    """
+    result = Counter()
+    if move and not os.path.lexists(dst):
+        os.makedirs(os.path.dirname(dst) or '.', exist_ok=True)
+        try:
+            os.rename(src, dst)
+            result['rename'] += 1
+            return result
+        except OSError:
+            pass
+
+    dirs_to_update = []
+    for root, dirs, file_names in os.walk(src, followlinks=True):
+        droot = join(dst, os.path.relpath(root, src))
+        os.makedirs(droot, exist_ok=True)
+        dirs_to_update.append((root, droot))
+        for fn in file_names:
+            result[transfer_file(join(root, fn), join(droot, fn), move, link)] += 1
+    for root, droot in reversed(dirs_to_update):
+        copystat(root, droot)
+    if move:
+        rmtree(src)
+    log.debug('transferred %s -> %s: %s', src, dst,
+              ', '.join('{} {}'.format(n, m) for m, n in sorted(result.items())))
+    return result
+
+
+def digest_tree(dpath, exclude=()):
+    """Return SHA-256 digest of names, modes, sizes and mtimes of files in dpath.
+
+    File contents are not read, None is returned if dpath doesn't exist.
+
+    :param exclude: fnmatch patterns (matched against paths relative to
+        dpath) of files and directories that should be ignored
+    """
+    if not isdir(dpath):
         return None
 
+    def excluded(path):
+        return any(fnmatch(path, pattern) for pattern in exclude)
+
+    result = hashlib.sha256()
+    for root, dirs, file_names in os.walk(dpath):
+        rroot = os.path.relpath(root, dpath)
+        rroot = '' if rroot == '.' else rroot + '/'
+        dirs[:] = sorted(i for i in dirs if not excluded(rroot + i))
+        for fn in sorted(file_names) + [i for i in dirs if islink(join(root, i))]:
+            rpath = rroot + fn
+            if excluded(rpath):
+                continue
+            fpath = join(root, fn)
+            try:
+                stat = os.lstat(fpath)
+                line = '{}\0{}\0{}\0{}'.format(rpath, stat.st_mode, stat.st_size,
+                                                stat.st_mtime_ns)
+                if islink(fpath):
+                    line += '\0' + os.readlink(fpath)
+            except FileNotFoundError:
+                # removed in the meantime (f.e. by a step invoked in parallel)
+                continue
+            result.update(line.encode('utf-8', 'surrogateescape') + b'\n')
+    return result.hexdigest()
+
+
+def shebang_replacement(interpreter, replacement=None):
+    """Return new shebang command for given interpreter.
+
+    :param interpreter: parsed shebang
+    :param replacement: new shebang command (path to interpreter and options)
+    :returns: new shebang command or None if current one is fine
+    """
     if not replacement and interpreter.version == '2':
         # we'll drop /usr/bin/python symlink from python package at some point
         replacement = '/usr/bin/python2'
         if interpreter.debug:
             replacement += '-dbg'
     elif not replacement and interpreter.path != '/usr/bin/':  # f.e. /usr/local/* or */bin/env
+        interpreter = Interpreter(interpreter)
         interpreter.path = '/usr/bin'
         replacement = repr(interpreter)
+    return replacement or None
+
+
+def fix_shebang(fpath, replacement=None, interpreter=None):
+    """Normalize file's shebang.
+
+    :param replacement: new shebang command (path to interpreter and options)
+    :param interpreter: file's already parsed shebang (to not read it again)
+    """
+    if interpreter is None:
+        try:
+            interpreter = Interpreter.from_file(fpath)
+        except Exception as err:
+            log.debug('fix_shebang (%s): %s', fpath, err)
+            return None
+
+    replacement = shebang_replacement(interpreter, replacement)
     if replacement:
         log.info('replacing shebang in %s', fpath)
         try:
-            with open(fpath, 'rb') as fp:
-                fcontent = fp.readlines()
+            rewrite_shebang(fpath, replacement)
         except IOError:
             log.error('cannot open %s', fpath)
             return False
-        # do not catch IOError here, the file is zeroed at this stage so it's
-        # better to fail
-        with open(fpath, 'wb') as fp:
-            fp.write(("#! %s\n" % replacement).encode('utf-8'))
-            fp.writelines(fcontent[1:])
     return True
 
 
-def so2pyver(fpath):
+def rewrite_shebang(fpath, replacement):
+    """Replace file's first line with given shebang command.
+
+    File is modified in place if the new line is as long as the old one
+    (and file's inode is not shared with other files). Otherwise the rest
+    of the file is copied to a temporary file that replaces the original
+    one. Symlinks are followed, their target is modified.
+    """
+    fpath = os.path.realpath(fpath)
+    line = ("#! %s\n" % replacement).encode('utf-8')
+    with open(fpath, 'rb') as fp:
+        old_line = fp.readline()
+        stat = os.fstat(fp.fileno())
+        if len(old_line) == len(line) and stat.st_nlink == 1:
+            with open(fpath, 'r+b') as fp_out:
+                fp_out.write(line)
+            return
+
+        tmp_fpath = join(split(fpath)[0], '.%s.dhpython' % split(fpath)[1])
+        try:
+            with open(tmp_fpath, 'wb') as fp_out:
+                fp_out.write(line)
+                copy_data(fp, fp_out, len(old_line))
+            os.chmod(tmp_fpath, S_IMODE(stat.st_mode))
+            os.replace(tmp_fpath, fpath)
+        except BaseException:
+            if exists(tmp_fpath):
+                os.remove(tmp_fpath)
+            raise
+
+
+def rewrite_shebangs(replacements, jobs=1):
+    """Replace shebangs in many files (using a thread pool if jobs != 1).
+
+    Files that cannot be rewritten are logged and skipped, symlinks
+    pointing to the same file are rewritten only once.
+
+    :param replacements: (file path, new shebang command) pairs
+    :param jobs: number of threads (see parallel_jobs)
+    :returns: number of files that could not be rewritten
+    """
+    todo = {}  # real path → (file path, new shebang command)
+    for fpath, replacement in replacements:
+        log.info('replacing shebang in %s', fpath)
+        todo.setdefault(os.path.realpath(fpath), (fpath, replacement))
+
+    def rewrite(item):
+        fpath, replacement = item
+        try:
+            rewrite_shebang(fpath, replacement)
+        except (IOError, OSError) as err:
+            log.error('cannot rewrite shebang in %s: %s', fpath, err)
+            return False
+        return True
+
+    if jobs != 1:
+        jobs = min(parallel_jobs(jobs), len(todo))
+    if jobs < 2:
+        return sum(not rewrite(item) for item in todo.values())
+    with ThreadPoolExecutor(jobs) as executor:
+        return sum(not ok for ok in executor.map(rewrite, todo.values()))
+
+
+def so2pyver(fpath, info=None):
     """Return libpython version file is linked to or None.
 
+    :param info: ELFInfo of this file, if already available
     :rtype: tuple
     :returns: Python version
     """
-
-    cmd = "readelf -Wd '%s'" % fpath
-    process = Popen(cmd, stdout=PIPE, shell=True)
-    encoding = locale.getdefaultlocale()[1] or 'utf-8'
-    match = SHAREDLIB_RE.search(str(process.stdout.read(), encoding=encoding))
-    if match:
-        return Version(match.groups()[0])
+    if info is None:
+        info = read_elf(fpath)
+    for name in info.needed if info else ():
+        match = SHAREDLIB_RE.match(name)
+        if match:
+            return Version(match.groups()[0])
 
 
 def clean_egg_name(name):
@@ -166,8 +396,14 @@ def parse_ns(fpaths, other=None):
     return result
 
 
-def remove_ns(interpreter, package, namespaces, versions):
-    """Remove empty __init__.py files for requested namespaces."""
+def remove_ns(interpreter, package, namespaces, versions, tree=None):
+    """Remove empty __init__.py files for requested namespaces.
+
+    :param tree: index of package's files
+    :type tree: TreeIndex
+    """
+    if tree is None:
+        tree = TreeIndex()
     if not isinstance(namespaces, set):
         namespaces = set(namespaces)
     keep = set()
@@ -175,7 +411,7 @@ def remove_ns(interpreter, package, namespaces, versions):
         for version in versions:
             fpath = join(interpreter.sitedir(package, version), *ns.split('.'))
             fpath = join(fpath, '__init__.py')
-            if not exists(fpath):
+            if not tree.exists(fpath):
                 continue
             if getsize(fpath) != 0:
                 log.warning('file not empty, cannot share %s namespace', ns)
@@ -190,21 +426,22 @@ def remove_ns(interpreter, package, namespaces, versions):
         for version in versions:
             dpath = join(interpreter.sitedir(package, version), *ns.split('.'))
             fpath = join(dpath, '__init__.py')
-            if exists(fpath):
-                os.remove(fpath)
-                if not os.listdir(dpath):
-                    os.rmdir(dpath)
+            if tree.exists(fpath):
+                tree.remove(fpath)
+                if not tree.listdir(dpath):
+                    tree.rmdir(dpath)
         # clean pyshared dir as well
         dpath = join('debian', package, 'usr/share/pyshared', *ns.split('.'))
         fpath = join(dpath, '__init__.py')
-        if exists(fpath):
-            os.remove(fpath)
-            if not os.listdir(dpath):
-                os.rmdir(dpath)
+        if tree.exists(fpath):
+            tree.remove(fpath)
+            if not tree.listdir(dpath):
+                tree.rmdir(dpath)
     return result
 
 
-def execute(command, cwd=None, env=None, log_output=None, shell=True):
+def execute(command, cwd=None, env=None, log_output=None, shell=True,
+            prefix=None):
     """Execute external shell command.
 
     :param cdw: current working directory
@@ -213,11 +450,18 @@ def execute(command, cwd=None, env=None, log_output=None, shell=True):
         * opened log file or path to this file, or
         * None if output should be included in the returned dict, or
         * False if output should be redirected to stdout/stderr
+    :param prefix: string added in front of each line of command's output
+        (used only if log_output is False, f.e. when commands for several
+        interpreters are invoked at the same time)
+    :returns: dict with returncode, stdout, stderr and stats (wall clock
+        time, user and system CPU time in seconds, max RSS in KiB and
+        number of block input/output operations)
     """
     args = {'shell': shell, 'cwd': cwd, 'env': env}
     close = False
     if log_output is False:
-        pass
+        if prefix:
+            args.update(stdout=PIPE, stderr=STDOUT)
     elif log_output is None:
         args.update(stdout=PIPE, stderr=PIPE)
     elif log_output:
@@ -230,12 +474,124 @@ def execute(command, cwd=None, env=None, log_output=None, shell=True):
         args.update(stdout=log_output, stderr=log_output)
 
     log.debug('invoking: %s', command)
+    start = monotonic()
+    stdout = stderr = None
     with Popen(command, **args) as process:
-        stdout, stderr = process.communicate()
+        if log_output is False and prefix:
+            prefix = prefix.encode('utf-8')
+            for line in process.stdout:
+                with _output_lock:
+                    sys.stdout.buffer.write(prefix + line)
+                    sys.stdout.buffer.flush()
+        elif log_output is None:
+            # read both pipes at the same time (just like communicate() does)
+            with ThreadPoolExecutor(1) as executor:
+                future = executor.submit(process.stderr.read)
+                stdout = process.stdout.read()
+                stderr = future.result()
+        rusage = _wait(process)
         close and log_output.close()
-        return dict(returncode=process.returncode,
-                    stdout=stdout and str(stdout, 'utf-8'),
-                    stderr=stderr and str(stderr, 'utf-8'))
+
+    stats = {'wall': round(monotonic() - start, 3)}
+    if rusage:
+        stats.update(utime=round(rusage.ru_utime, 3),
+                     stime=round(rusage.ru_stime, 3),
+                     maxrss=rusage.ru_maxrss,  # in KiB
+                     inblock=rusage.ru_inblock,
+                     oublock=rusage.ru_oublock)
+    return dict(returncode=process.returncode,
+                stdout=stdout and str(stdout, 'utf-8'),
+                stderr=stderr and str(stderr, 'utf-8'),
+                stats=stats)
+
+
+def _wait(process):
+    """Wait for process to finish, return its resource usage (see wait4(2)).
+
+    Unlike getrusage(RUSAGE_CHILDREN), it's not affected by other commands
+    invoked at the same time (in other threads).
+    """
+    try:
+        _, status, rusage = os.wait4(process.pid, 0)
+    except ChildProcessError:
+        # already reaped (f.e. SIGCHLD is ignored)
+        process.wait()
+        return None
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return rusage
+
+
+# log records emitted in a worker process, replayed by the main one
+_log_records = []
+
+
+class _RecordCollector(logging.Handler):
+    def __init__(self, records=_log_records):
+        super().__init__()
+        self.records = records
+
+    def emit(self, record):
+        # arguments and tracebacks are not always picklable
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.msg += '\n' + logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        self.records.append(record)
+
+
+def capture_logs():
+    """Collect log records instead of emitting them (in a worker process).
+
+    Records returned by :func:`captured_logs` can be passed to
+    log.handle() in the main process, to keep the output in order.
+    """
+    log.handlers = [_RecordCollector()]
+    log.propagate = False
+
+
+def captured_logs():
+    """Return (and forget) log records collected so far."""
+    result = _log_records[:]
+    del _log_records[:]
+    return result
+
+
+@contextmanager
+def recorded_logs():
+    """Collect log records emitted in the with block.
+
+    Records are emitted as usual as well, the collected ones can be
+    pickled and passed to log.handle() later (f.e. in the next run).
+    """
+    handler = _RecordCollector([])
+    log.addHandler(handler)
+    try:
+        yield handler.records
+    finally:
+        log.removeHandler(handler)
+
+
+def parallel_jobs(requested=0):
+    """Return number of jobs that can be invoked at the same time.
+
+    parallel=N from DEB_BUILD_OPTIONS is used as an upper limit.
+
+    :param requested: number of jobs requested by the user, 0 means as many
+        as DEB_BUILD_OPTIONS (or number of CPUs if it's not set) allows
+    """
+    limit = None
+    for option in os.environ.get('DEB_BUILD_OPTIONS', '').split():
+        if option.startswith('parallel='):
+            try:
+                limit = int(option[9:])
+            except ValueError:
+                log.warning('invalid DEB_BUILD_OPTIONS: %s', option)
+    if not requested:
+        requested = limit or os.cpu_count() or 1
+    elif limit:
+        requested = min(requested, limit)
+    return max(requested, 1)
 
 
 class memoize:
@@ -250,11 +606,17 @@ class memoize:
         return self.cache[key]
 
 
-def pyinstall(interpreter, package, vrange):
-    """Install local files listed in pkg.pyinstall files as public modules."""
+def pyinstall(interpreter, package, vrange, tree=None):
+    """Install local files listed in pkg.pyinstall files as public modules.
+
+    :param tree: index of package's files
+    :type tree: TreeIndex
+    """
     srcfpath = "./debian/%s.pyinstall" % package
     if not exists(srcfpath):
         return
+    if tree is None:
+        tree = TreeIndex()
     impl = interpreter.impl
     versions = get_requested_versions(impl, vrange)
 
@@ -285,19 +647,23 @@ def pyinstall(interpreter, package, vrange):
                 dstname = fpath
             for version in myvers:
                 dstfpath = join(interpreter.sitedir(package, version), dstname)
-                dstdir = split(dstfpath)[0]
-                if not exists(dstdir):
-                    os.makedirs(dstdir)
-                if exists(dstfpath):
-                    os.remove(dstfpath)
-                os.link(fpath, dstfpath)
+                tree.makedirs(split(dstfpath)[0])
+                if tree.exists(dstfpath):
+                    tree.remove(dstfpath)
+                tree.link(fpath, dstfpath)
 
 
-def pyremove(interpreter, package, vrange):
-    """Remove public modules listed in pkg.pyremove file."""
+def pyremove(interpreter, package, vrange, tree=None):
+    """Remove public modules listed in pkg.pyremove file.
+
+    :param tree: index of package's files
+    :type tree: TreeIndex
+    """
     srcfpath = "./debian/%s.pyremove" % package
     if not exists(srcfpath):
         return
+    if tree is None:
+        tree = TreeIndex()
     impl = interpreter.impl
     versions = get_requested_versions(impl, vrange)
 
@@ -316,14 +682,15 @@ def pyremove(interpreter, package, vrange):
             site_dirs = interpreter.old_sitedirs(package, version)
             site_dirs.append(interpreter.sitedir(package, version))
             for sdir in site_dirs:
-                files = glob(sdir + '/' + details['pattern'])
+                files = tree.glob(sdir + '/' + details['pattern'])
                 for fpath in files:
-                    if isdir(fpath):
-                        rmtree(fpath)
+                    if tree.isdir(fpath):
+                        tree.rmtree(fpath)
                     else:
-                        os.remove(fpath)
+                        tree.remove(fpath)
 
 from dhpython.interpreter import Interpreter
+from dhpython.tree import TreeIndex
 from dhpython.version import Version, get_requested_versions, RANGE_PATTERN
 INSTALL_RE = re.compile(r"""
     (?P<pattern>.+?)  # file pattern
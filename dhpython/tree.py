@@ -0,0 +1,264 @@
+# Copyright © 2026 dh-python developers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import errno
+import logging
+import os
+import shutil
+from fnmatch import fnmatchcase
+from glob import has_magic
+from os.path import join, normpath, split
+
+log = logging.getLogger('dhpython')
+
+
+class TreeIndex:
+    """In-memory index of directory trees.
+
+    Each directory is listed (with os.scandir) only once, all further
+    queries are answered from memory. Changes made via methods of this
+    class keep the index up to date, other ones have to be reported with
+    forget().
+
+    >>> tree = TreeIndex()
+    >>> tree.isdir('/')
+    True
+    """
+
+    def __init__(self, *roots):
+        """:param roots: directories to index up front (recursively)"""
+        # directory → ({subdirectory: is symlink}, {file: is symlink})
+        self._dirs = {}
+        for root in roots:
+            self.index(root)
+
+    def index(self, top):
+        """Read whole directory tree at once."""
+        todo = [normpath(top)]
+        while todo:
+            dpath = todo.pop()
+            listing = self._listing(dpath)
+            if listing:
+                todo.extend(join(dpath, name)
+                            for name, is_link in listing[0].items()
+                            if not is_link)
+
+    def forget(self, dpath):
+        """Read given directory again next time it is needed."""
+        self._dirs.pop(normpath(dpath), None)
+
+    def _listing(self, dpath):
+        listing = self._dirs.get(dpath)
+        if listing is None:
+            dirs, files = {}, {}
+            try:
+                with os.scandir(dpath) as entries:
+                    for entry in entries:
+                        try:
+                            is_dir = entry.is_dir()
+                        except OSError:
+                            is_dir = False
+                        if is_dir:
+                            dirs[entry.name] = entry.is_symlink()
+                        else:
+                            files[entry.name] = entry.is_symlink()
+            except (FileNotFoundError, NotADirectoryError):
+                return None
+            listing = self._dirs[dpath] = (dirs, files)
+        return listing
+
+    @staticmethod
+    def _split(path):
+        path = normpath(path)
+        if path in ('.', '/'):
+            return path, ''
+        head, name = split(path)
+        return head or '.', name
+
+    def _entry(self, path):
+        """Return (is directory, is symlink) tuple or None if path is missing."""
+        head, name = self._split(path)
+        if not name:
+            return True, False
+        listing = self._listing(head)
+        if listing is None:
+            return None
+        if name in listing[0]:
+            return True, listing[0][name]
+        if name in listing[1]:
+            return False, listing[1][name]
+
+    def lexists(self, path):
+        return self._entry(path) is not None
+
+    def exists(self, path):
+        entry = self._entry(path)
+        if entry is None:
+            return False
+        if entry[1]:  # symlinks can be dangling
+            return os.path.exists(path)
+        return True
+
+    def isdir(self, path):
+        entry = self._entry(path)
+        return entry is not None and entry[0]
+
+    def islink(self, path):
+        entry = self._entry(path)
+        return entry is not None and entry[1]
+
+    def listdir(self, dpath):
+        listing = self._listing(normpath(dpath))
+        if listing is None:
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), dpath)
+        return sorted(listing[0].keys() | listing[1].keys())
+
+    def walk(self, top, topdown=True):
+        """Generate directory tree like os.walk (symlinks are not followed)."""
+        top = normpath(top)
+        listing = self._listing(top)
+        if listing is None:
+            return
+        dirs, files = list(listing[0]), list(listing[1])
+        if topdown:
+            yield top, dirs, files
+        for name in dirs:
+            # the index could have changed in the meantime
+            listing = self._dirs.get(top)
+            if listing is None or not listing[0].get(name):
+                yield from self.walk(join(top, name), topdown)
+        if not topdown:
+            yield top, dirs, files
+
+    def glob(self, pattern):
+        """Return paths matching given pattern (like glob.glob)."""
+        dirname, basename = split(pattern)
+        if not has_magic(pattern):
+            return [pattern] if self.lexists(pattern) else []
+        if not dirname:
+            dirs = ['']
+        elif has_magic(dirname):
+            dirs = [i for i in self.glob(dirname) if self.isdir(i)]
+        else:
+            dirs = [dirname] if self.isdir(dirname) else []
+        result = []
+        for dpath in dirs:
+            listing = self._listing(normpath(dpath or '.'))
+            if listing is None:
+                continue
+            if not has_magic(basename):
+                if basename in listing[0] or basename in listing[1]:
+                    result.append(join(dpath, basename))
+                continue
+            for name in sorted(listing[0].keys() | listing[1].keys()):
+                if name.startswith('.') and not basename.startswith('.'):
+                    continue
+                if fnmatchcase(name, basename):
+                    result.append(join(dpath, name))
+        return result
+
+    def _added(self, path, is_dir=False, is_link=False):
+        head, name = self._split(path)
+        while name:
+            listing = self._dirs.get(head)
+            if listing is not None:
+                dirs, files = listing
+                if not is_dir:
+                    dirs.pop(name, None)
+                    files[name] = is_link
+                elif name in dirs:
+                    return
+                else:
+                    files.pop(name, None)
+                    dirs[name] = is_link
+            # parent directories could be created as well
+            is_dir, is_link = True, False
+            head, name = self._split(head)
+
+    def _removed(self, path):
+        path = normpath(path)
+        head, name = self._split(path)
+        listing = self._dirs.get(head)
+        if listing is not None:
+            listing[1].pop(name, None)
+            if listing[0].pop(name, None) is None:
+                return
+        prefix = path + '/'
+        for dpath in [i for i in self._dirs if i == path or i.startswith(prefix)]:
+            del self._dirs[dpath]
+
+    def remove(self, path):
+        os.remove(path)
+        self._removed(path)
+
+    def rmtree(self, path):
+        shutil.rmtree(path)
+        self._removed(path)
+
+    def rmdir(self, dpath):
+        listing = self._dirs.get(normpath(dpath))
+        if listing and (listing[0] or listing[1]):
+            raise OSError(errno.ENOTEMPTY, os.strerror(errno.ENOTEMPTY), dpath)
+        os.rmdir(dpath)
+        self._removed(dpath)
+
+    def removedirs(self, dpath):
+        """Remove directory and its parents while they're empty (like os.removedirs)."""
+        self.rmdir(dpath)
+        head, tail = split(normpath(dpath))
+        while head and tail:
+            try:
+                self.rmdir(head)
+            except OSError:
+                break
+            head, tail = split(head)
+
+    def makedirs(self, dpath):
+        """Create directory (and its parents), it's OK if it already exists."""
+        if self.isdir(dpath):
+            return
+        os.makedirs(dpath, exist_ok=True)
+        self._added(dpath, is_dir=True)
+
+    def rename(self, src, dst):
+        entry = self._entry(src)
+        os.rename(src, dst)
+        self._removed(src)
+        self._removed(dst)
+        if entry is None:  # not indexed yet
+            entry = os.path.isdir(dst), os.path.islink(dst)
+        self._added(dst, *entry)
+
+    def renames(self, src, dst):
+        """Rename file, create/remove directories as needed (like os.renames)."""
+        head = split(dst)[0]
+        if head:
+            self.makedirs(head)
+        self.rename(src, dst)
+        head = split(src)[0]
+        if head:
+            try:
+                self.removedirs(head)
+            except OSError:
+                pass
+
+    def link(self, src, dst):
+        os.link(src, dst)
+        self._added(dst)
@@ -0,0 +1,74 @@
+#! /usr/bin/python3
+"""Compare regular expressions and DirClassifier on a deep synthetic tree.
+
+Usage: python3 -m tests.benchmark_dirs [DEPTH [FILES_PER_DIR]]
+"""
+import sys
+from os.path import join
+from timeit import timeit
+
+from dhpython import MULTIARCH_DIR_TPL
+from dhpython.fs import DirClassifier
+from dhpython.interpreter import Interpreter
+
+
+def synthetic_tree(depth, files_per_dir):
+    """Return (directory, file names) pairs, like os.walk."""
+    prefixes = ('debian/python3-foo/usr/lib/python3/dist-packages',
+                'debian/python3-foo/usr/lib/python3.12/site-packages',
+                'debian/python3-foo/usr/lib/x86_64-linux-gnu/foo',
+                'debian/python3-foo/usr/share/python3-foo')
+    result = []
+    for prefix in prefixes:
+        dpath = prefix
+        for level in range(depth):
+            for sibling in ('pkg', 'tests', 'data'):
+                result.append((join(dpath, sibling),
+                               ['mod%d.py' % i for i in range(files_per_dir)] +
+                               ['_ext%d.so' % i for i in range(files_per_dir // 10)]))
+            dpath = join(dpath, 'pkg%d' % level)
+    return result
+
+
+def with_regexes(tree, interpreter):
+    result = []
+    for dpath, file_names in tree:
+        if interpreter.should_ignore(dpath):
+            continue
+        version = interpreter.parse_public_dir(dpath)
+        for fn in file_names:
+            if fn.endswith('.so'):
+                multiarch = bool(MULTIARCH_DIR_TPL.match(join(dpath, fn)))
+                result.append((fn, version, multiarch))
+    return result
+
+
+def with_classifier(tree, impl):
+    classifier = DirClassifier(impl)
+    result = []
+    for dpath, file_names in tree:
+        ignored, version, multiarch = classifier.classify(dpath)
+        if ignored:
+            continue
+        for fn in file_names:
+            if fn.endswith('.so'):
+                # file names do not match MULTIARCH_DIR_TPL here
+                result.append((fn, version, multiarch))
+    return result
+
+
+def main(depth=50, files_per_dir=100):
+    tree = synthetic_tree(depth, files_per_dir)
+    interpreter = Interpreter('python3')
+    nfiles = sum(len(i[1]) for i in tree)
+    print('%d directories, %d files' % (len(tree), nfiles))
+    assert with_regexes(tree, interpreter) == with_classifier(tree, interpreter.impl)
+    for name, func, arg in (('regexes', with_regexes, interpreter),
+                            ('classifier', with_classifier, interpreter.impl)):
+        seconds = timeit(lambda: func(tree, arg), number=10) / 10
+        print('%-10s %8.2f ms, %6.0f ns per directory' % (
+            name, seconds * 1000, seconds * 1e9 / len(tree)))
+
+
+if __name__ == '__main__':
+    main(*(int(i) for i in sys.argv[1:]))
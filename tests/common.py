@@ -3,6 +3,7 @@ class FakeOptions:
         opts = {
             'depends': (),
             'depends_section': (),
+            'detect_abi3': False,
             'guess_deps': False,
             'no_ext_rename': False,
             'recommends': (),
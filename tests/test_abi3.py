@@ -0,0 +1,104 @@
+import os
+import unittest
+from tempfile import TemporaryDirectory
+
+from dhpython.build.abi3 import StableABIBuilds, has_abi3_extensions_only
+from dhpython.version import Version
+
+
+class TestStableABIBuilds(unittest.TestCase):
+    versions = [Version('3.12'), Version('3.13'), Version('3.11')]  # 3.11 is default
+
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def path(self, *parts):
+        return os.path.join(self.tmpdir.name, *parts)
+
+    def write(self, *parts):
+        fpath = self.path(*parts)
+        os.makedirs(os.path.dirname(fpath), exist_ok=True)
+        with open(fpath, 'w') as fp:
+            fp.write(parts[-1])
+        return fpath
+
+    def args(self, version):
+        return {'interpreter': 'python{}'.format(version),
+                'home_dir': self.path(str(version)),
+                'build_dir': self.path(str(version), 'build'),
+                'destdir': self.path('destdir'),
+                'install_dir': '/usr/lib/python{}/dist-packages'.format(version)}
+
+    def test_sort(self):
+        builds = StableABIBuilds('no')
+        self.assertEqual(builds.sort('python{version}', self.versions), self.versions)
+        self.assertEqual(builds.references, {})
+        builds = StableABIBuilds('auto')
+        self.assertEqual(builds.sort('python{version}', self.versions, parallel=True),
+                         self.versions)
+        self.assertEqual(builds.sort('python{version}', self.versions),
+                         [Version('3.11'), Version('3.12'), Version('3.13')])
+        self.assertEqual(builds.references, {'python{version}': Version('3.11')})
+        self.assertEqual(builds.sort('python3', self.versions[:1]), self.versions[:1])
+
+    def test_reference_yes(self):
+        builds = StableABIBuilds('yes')
+        builds.sort('python{version}', self.versions, parallel=True)
+        for step in ('configure', 'build', 'install'):
+            self.assertIsNone(builds.reference(step, 'python{version}',
+                                               Version('3.11'), self.args))
+            self.assertEqual(builds.reference(step, 'python{version}',
+                                              Version('3.13'), self.args),
+                             Version('3.11'))
+
+    def test_reference_auto(self):
+        builds = StableABIBuilds('auto')
+        builds.sort('python{version}', self.versions)
+        i, version = 'python{version}', Version('3.12')
+        self.write('3.11', 'build', 'foo', '_foo.abi3.so')
+        # not built yet
+        self.assertIsNone(builds.reference('build', i, version, self.args))
+        self.write('3.11', 'build.stamp')
+        # built by previous pybuild call
+        self.assertIsNone(builds.reference('configure', i, version, self.args))
+        self.assertEqual(builds.reference('install', i, version, self.args),
+                         Version('3.11'))
+        # result is remembered
+        builds.built.add((i, Version('3.11')))
+        self.assertEqual(builds.reference('configure', i, version, self.args),
+                         Version('3.11'))
+
+    def test_reference_auto_not_abi3(self):
+        builds = StableABIBuilds('auto')
+        builds.sort('python{version}', self.versions)
+        self.write('3.11', 'build.stamp')
+        self.write('3.11', 'build', 'foo', '_foo.abi3.so')
+        self.write('3.11', 'build', 'foo', '_bar.cpython-311-x86_64-linux-gnu.so')
+        self.assertIsNone(builds.reference('build', 'python{version}',
+                                           Version('3.12'), self.args))
+
+    def test_has_abi3_extensions_only(self):
+        self.assertFalse(has_abi3_extensions_only(self.path()))
+        self.write('foo', '__init__.py')
+        self.assertFalse(has_abi3_extensions_only(self.path()))
+        self.write('foo', '_foo.abi3.so')
+        self.assertTrue(has_abi3_extensions_only(self.path()))
+        self.write('foo', 'libbar.so')
+        self.assertFalse(has_abi3_extensions_only(self.path()))
+
+    def test_reuse(self):
+        ref_args, args = self.args(Version('3.11')), self.args(Version('3.12'))
+        self.assertFalse(StableABIBuilds.reuse('build', ref_args, args))
+        src = self.write('3.11', 'build', 'foo', '_foo.abi3.so')
+        self.write('3.12', 'build', 'foo', '_foo.cpython-312.so')  # stale one
+        self.assertTrue(StableABIBuilds.reuse('build', ref_args, args))
+        self.assertEqual(os.listdir(self.path('3.12', 'build', 'foo')), ['_foo.abi3.so'])
+        # files are copied
+        dst = self.path('3.12', 'build', 'foo', '_foo.abi3.so')
+        self.assertNotEqual(os.stat(src).st_ino, os.stat(dst).st_ino)
+
+        self.write('destdir', 'usr/lib/python3.11/dist-packages', 'foo', '_foo.abi3.so')
+        self.assertTrue(StableABIBuilds.reuse('install', ref_args, args))
+        self.assertTrue(os.path.exists(self.path(
+            'destdir', 'usr/lib/python3.12/dist-packages', 'foo', '_foo.abi3.so')))
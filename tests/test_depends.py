@@ -5,7 +5,9 @@ import unittest
 from copy import deepcopy
 from pickle import dumps
 from tempfile import TemporaryDirectory
+from unittest.mock import patch
 
+from dhpython import pydist
 from dhpython.depends import Dependencies
 from dhpython.version import Version
 
@@ -724,3 +726,49 @@ class TestIgnoresUnusedModulesEggInfo(DependenciesTestCase):
             raise unittest.SkipTest("Requires Python >= 3.10")
         with self.assertNoLogs(logger='dhpython', level=logging.INFO):
             self.d.parse(self.prepared_stats, self.options)
+
+
+class TestPyDistIndex(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = TemporaryDirectory()
+        self.addCleanup(self.tempdir.cleanup)
+        old_wd = os.getcwd()
+        os.chdir(self.tempdir.name)
+        self.addCleanup(os.chdir, old_wd)
+        os.mkdir('debian')
+        with open('debian/py3dist-overrides', 'w') as fp:
+            fp.write('foo python3-foo-override\n')
+        with open('cpython3_fallback', 'w') as fp:
+            fp.write('# comment\nBar_Baz python3-barbaz\nfoo python3-foo\n')
+        env = patch.dict(os.environ, {'DH_PYTHON_DIST': self.tempdir.name,
+                                      'XDG_CACHE_HOME': self.tempdir.name})
+        env.start()
+        self.addCleanup(env.stop)
+        self.addCleanup(pydist.load.cache.clear)
+        pydist.load.cache.clear()
+
+    def load(self):
+        pydist.load.cache.clear()
+        data = pydist.load('cpython3')
+        return data, [i['dependency'] for i in data.get('foo')]
+
+    def test_index(self):
+        data, foo = self.load()
+        self.assertIsInstance(data, dict)  # parsed, index written
+        with patch('dhpython.pydist.parse_pydist') as parse_pydist:
+            index, index_foo = self.load()
+        parse_pydist.assert_not_called()
+        self.assertIsInstance(index, pydist.PyDistIndex)
+        self.assertEqual(index_foo, foo)
+        self.assertEqual(foo, ['python3-foo-override', 'python3-foo'])
+        self.assertEqual(index.get('bar_baz'), data['bar_baz'])
+        self.assertIsNone(index.get('bar'))
+        self.assertEqual(len(index), len(data))
+
+    def test_outdated_index(self):
+        self.load()
+        with open('cpython3_fallback', 'a') as fp:
+            fp.write('spam python3-spam\n')
+        data, _ = self.load()
+        self.assertIsInstance(data, dict)
+        self.assertIn('spam', data)
@@ -0,0 +1,161 @@
+from os.path import dirname, join
+from subprocess import run, PIPE, STDOUT
+from tempfile import TemporaryDirectory
+import os
+import shutil
+import sys
+import unittest
+
+from tests.test_elf import build_elf
+
+TOP_DIR = dirname(dirname(os.path.abspath(__file__)))
+
+
+class DhPython3TestCase(unittest.TestCase):
+    """Invoke dh_python3 on packages built from given files"""
+    control = '''Source: foo
+Build-Depends: python3-all-dev
+
+Package: python3-foo
+Architecture: any
+Depends: ${python3:Depends}
+'''
+    # package name: {path: content}
+    files = {
+        'python3-foo': {
+            'usr/lib/python3/dist-packages/foo/__init__.py': '',
+            'usr/lib/python3/dist-packages/foo/_foo.cpython-311-x86_64-linux-gnu.so':
+                build_elf(2, '<', defined=['PyInit__foo']),
+        },
+    }
+    env = {'DEBPYTHON3_DEFAULT': '3.11', 'DEBPYTHON3_SUPPORTED': '3.11'}
+
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.write('debian/control', self.control)
+        for package, files in self.files.items():
+            for fn, content in files.items():
+                self.write(join('debian', package, fn), content)
+
+    def path(self, *parts):
+        return join(self.tmpdir.name, *parts)
+
+    def write(self, fn, content):
+        fpath = self.path(fn)
+        os.makedirs(dirname(fpath), exist_ok=True)
+        with open(fpath, 'wb' if isinstance(content, bytes) else 'w') as fp:
+            fp.write(content)
+
+    def dh_python3(self, *args, returncode=0, cwd=None, **env):
+        env = dict(os.environ, PYTHONPATH=TOP_DIR, DEB_HOST_ARCH='amd64',
+                   DEB_HOST_MULTIARCH='x86_64-linux-gnu', **dict(self.env, **env))
+        for name in ('DH_VERBOSE', 'DH_OPTIONS', 'DH_INTERNAL_OVERRIDE'):
+            env.pop(name, None)
+        result = run([sys.executable, join(TOP_DIR, 'dh_python3')] + list(args),
+                     cwd=cwd or self.path(), env=env, stdout=PIPE, stderr=STDOUT,
+                     universal_newlines=True)
+        self.assertEqual(result.returncode, returncode, result.stdout)
+        return result.stdout
+
+    def generated_files(self, cwd=None):
+        """Return (and remove) content of files generated for debhelper"""
+        dpath = join(cwd or self.path(), 'debian')
+        result = {}
+        for fn in sorted(os.listdir(dpath)):
+            if not fn.endswith(('.substvars', '.debhelper')) or fn == '.debhelper':
+                continue
+            with open(join(dpath, fn)) as fp:
+                result[fn] = fp.read()
+            os.remove(join(dpath, fn))
+        return result
+
+
+class TestManifest(DhPython3TestCase):
+
+    def fresh_run(self, **env):
+        """Return files generated without results of the previous runs"""
+        with TemporaryDirectory() as cwd:
+            shutil.copytree(self.path('debian'), join(cwd, 'debian'),
+                            ignore=shutil.ignore_patterns('.debhelper'))
+            self.dh_python3(cwd=cwd, **env)
+            return self.generated_files(cwd)
+
+    def test_unchanged(self):
+        self.dh_python3()
+        expected = self.generated_files()
+        self.dh_python3()
+        self.assertEqual(self.generated_files(), expected)
+
+    def test_supported_versions_changed(self):
+        self.dh_python3()
+        self.generated_files()
+        env = {'DEBPYTHON3_DEFAULT': '3.12', 'DEBPYTHON3_SUPPORTED': '3.11,3.12'}
+        expected = self.fresh_run(**env)
+        self.dh_python3(**env)
+        self.assertEqual(self.generated_files(), expected)
+        self.assertNotIn('<< 3.12', expected['python3-foo.substvars'])
+
+
+class TestParallel(DhPython3TestCase):
+    control = '''Source: foo
+Build-Depends: python3-all
+
+Package: python3-foo
+Architecture: all
+Depends: ${python3:Depends}
+
+Package: foo-tools
+Architecture: all
+Depends: ${python3:Depends}
+
+Package: python3-bar
+Architecture: all
+Depends: ${python3:Depends}
+'''
+    files = {
+        'python3-foo': {
+            'usr/lib/python3/dist-packages/foo/__init__.py': 'import bar\n',
+            'usr/lib/python3/dist-packages/foo-1.0.dist-info/METADATA':
+                'Name: foo\nVersion: 1.0\nRequires-Dist: bar\n',
+        },
+        'foo-tools': {
+            'usr/bin/foo': '#! /usr/bin/env python3\nimport foo\n',
+            'usr/share/foo-tools/foo_tools.py': '',
+        },
+        'python3-bar': {
+            'usr/lib/python3.11/site-packages/bar.py': '',
+        },
+    }
+
+    def run_copy(self, *args, returncode=0):
+        """Invoke dh_python3 on a copy of the packages, return its results"""
+        with TemporaryDirectory() as cwd:
+            shutil.copytree(self.path('debian'), join(cwd, 'debian'))
+            output = self.dh_python3(*args, cwd=cwd, returncode=returncode)
+            return output, self.generated_files(cwd)
+
+    def test_same_files(self):
+        _, serial = self.run_copy()
+        self.assertIn('foo-tools.postinst.debhelper', serial)
+        self.assertIn('python3-bar.substvars', serial)
+        for jobs in ('--parallel=2', '--parallel=3'):
+            _, parallel = self.run_copy(jobs)
+            self.assertEqual(parallel, serial)
+
+    def test_failure(self):
+        # both packages fail, the error of the first one is reported
+        self.write('debian/foo-tools.pyinstall', 'missing-tools.py\n')
+        self.write('debian/python3-bar.pyinstall', 'missing-bar.py\n')
+        output, _ = self.run_copy(returncode=4)
+        self.assertIn('missing-tools.py', output)
+        output, generated = self.run_copy('--parallel=3', returncode=4)
+        # logs of packages are replayed in order, up to the failed one
+        self.assertLess(output.index('provides bar'),
+                        output.index('missing-tools.py'))
+        self.assertNotIn('missing-bar.py', output)
+        self.assertEqual(generated, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
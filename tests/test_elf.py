@@ -0,0 +1,81 @@
+import struct
+import unittest
+from glob import glob
+from tempfile import NamedTemporaryFile
+
+from dhpython.elf import read_elf
+from dhpython.tools import so2pyver
+
+
+def build_elf(elf_class, order, needed=(), soname=None, defined=(), undefined=()):
+    """Return minimal ELF shared object with dynamic section and symbols."""
+    wide = elf_class == 2
+    strtab = b'\0'
+    offsets = {}
+    for name in list(needed) + [soname] + list(defined) + list(undefined):
+        if name:
+            offsets[name] = len(strtab)
+            strtab += name.encode() + b'\0'
+
+    dyn = struct.Struct(order + ('qQ' if wide else 'iI'))
+    dynamic = b''.join(dyn.pack(1, offsets[i]) for i in needed)
+    if soname:
+        dynamic += dyn.pack(14, offsets[soname])
+    dynamic += dyn.pack(0, 0)
+
+    sym = struct.Struct(order + ('IBBHQQ' if wide else 'IIIBBH'))
+    symbols = [(0, 0, 0)]  # (name, info, shndx), first one is always empty
+    symbols += [(offsets[i], 0x12, 1) for i in defined]  # GLOBAL FUNC
+    symbols += [(offsets[i], 0x12, 0) for i in undefined]
+    if wide:
+        dynsym = b''.join(sym.pack(n, i, 0, s, 0, 0) for n, i, s in symbols)
+    else:
+        dynsym = b''.join(sym.pack(n, 0, 0, i, 0, s) for n, i, s in symbols)
+
+    ehsize = 64 if wide else 52
+    body = strtab + dynamic + dynsym
+    shdr = struct.Struct(order + ('IIQQQQIIQQ' if wide else 'IIIIIIIIII'))
+    sections = [shdr.pack(*[0] * 10),
+                shdr.pack(0, 3, 0, 0, ehsize, len(strtab), 0, 0, 1, 0),
+                shdr.pack(0, 6, 0, 0, ehsize + len(strtab), len(dynamic), 1, 0, 8, dyn.size),
+                shdr.pack(0, 11, 0, 0, ehsize + len(strtab) + len(dynamic),
+                          len(dynsym), 1, 1, 8, sym.size)]
+    shoff = ehsize + len(body)
+    ident = b'\x7fELF' + bytes([elf_class, 1 if order == '<' else 2, 1]) + b'\0' * 9
+    header = struct.pack(order + ('HHIQQQIHHHHHH' if wide else 'HHIIIIIHHHHHH'),
+                         3, 62, 1, 0, 0, shoff, 0, ehsize, 0, 0, shdr.size,
+                         len(sections), 0)
+    return ident + header + body + b''.join(sections)
+
+
+class TestReadELF(unittest.TestCase):
+    def read(self, data):
+        with NamedTemporaryFile(suffix='.so') as fp:
+            fp.write(data)
+            fp.flush()
+            return read_elf(fp.name), so2pyver(fp.name)
+
+    def test_classes(self):
+        for elf_class in (1, 2):
+            for order in '<>':
+                with self.subTest(elf_class=elf_class, order=order):
+                    info, version = self.read(build_elf(
+                        elf_class, order, needed=['libpython3.11.so.1.0', 'libc.so.6'],
+                        soname='foo.so', defined=['PyInit_foo'],
+                        undefined=['PyModule_Create2']))
+                    self.assertEqual(info.needed, ['libpython3.11.so.1.0', 'libc.so.6'])
+                    self.assertEqual(info.soname, 'foo.so')
+                    self.assertEqual(info.defined, {'PyInit_foo'})
+                    self.assertEqual(info.undefined, {'PyModule_Create2'})
+                    self.assertEqual(str(version), '3.11')
+
+    def test_not_elf(self):
+        self.assertEqual(self.read(b'#!/bin/sh\n'), (None, None))
+        self.assertEqual(self.read(b'\x7fELF\x02\x01'), (None, None))
+
+    @unittest.skipUnless(glob('/usr/lib/python3*/lib-dynload/_json.*.so'),
+                         'Python extensions are not installed')
+    def test_extension(self):
+        info = read_elf(glob('/usr/lib/python3*/lib-dynload/_json.*.so')[0])
+        self.assertIn('PyInit__json', info.defined)
+        self.assertIn('PyArg_ParseTuple', info.undefined)
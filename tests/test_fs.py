@@ -1,12 +1,21 @@
 from tempfile import TemporaryDirectory
+import os
 from pathlib import Path
 from unittest import TestCase
+from unittest.mock import patch
 
+from dhpython import MULTIARCH_DIR_TPL
+from dhpython.elf import read_elf
 from dhpython.interpreter import Interpreter
+from dhpython.version import Version
+from dhpython.manifest import Manifest
 from dhpython.fs import (
-    fix_merged_RECORD, merge_RECORD, merge_WHEEL, missing_lines, share_files)
+    DirClassifier, FileDigests, FileKinds, Scan, fix_merged_RECORD, merge_RECORD, merge_WHEEL,
+    missing_lines, share_files)
+from dhpython.tools import rewrite_shebangs
 
 from tests.common import FakeOptions
+from tests.test_elf import build_elf
 
 
 class MergeWheelTestCase(TestCase):
@@ -143,3 +152,444 @@ class FlitLicenseTest(ShareFilesTestCase):
         self.assertFileContents(self.destPath('foo.dist-info/RECORD'),
             'foo.dist-info/WHEEL,sha256=447fb61fa39a067229e1cce8fc0953bfced53ea'
             'c85d1844f5940f51c1fcba725,6\n')
+
+
+class FileDigestsTest(MergeWheelTestCase):
+    files = {
+        'a/foo.py': ('foo',),
+        'b/foo.py': ('foo',),
+        'c/foo.py': ('bar',),
+        'c/bar.py': ('bar',),
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.digests = FileDigests()
+        self.dirs = [str(Path(self.tempdir.name) / i) for i in 'abc']
+
+    def test_same(self):
+        a, b, c = (str(Path(i) / 'foo.py') for i in self.dirs)
+        self.assertTrue(self.digests.same(a, b))
+        self.assertFalse(self.digests.same(a, c))
+
+    def test_modified_file(self):
+        a, b = (str(Path(i) / 'foo.py') for i in self.dirs[:2])
+        self.assertTrue(self.digests.same(a, b))
+        with open(b, 'w') as fp:
+            fp.write('baz\n')
+        self.assertFalse(self.digests.same(a, b))
+
+    def test_prefetch(self):
+        self.digests.prefetch(self.dirs, jobs=2)
+        # bar.py doesn't have a counterpart in other directories
+        self.assertEqual(len(self.digests._digests), 3)
+
+
+class FileKindsTest(TestCase):
+    files = {
+        'script': b'#! /usr/bin/env python3\nprint(1)\n',
+        'lib.so': b'\x7fELF\x02\x01\x01\0\0\0',
+        'data.bin': b'foo\0bar',
+        'README': b'foo\n',
+    }
+
+    def setUp(self):
+        tempdir = TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.root = Path(tempdir.name)
+        for fn, content in self.files.items():
+            (self.root / fn).write_bytes(content)
+        (self.root / 'link').symlink_to('script')
+        self.kinds = FileKinds()
+
+    def test_kinds(self):
+        kinds = {fn: self.kinds.get(str(self.root / fn))[0]
+                 for fn in self.files}
+        self.assertEqual(kinds, {'script': 'script', 'lib.so': 'elf',
+                                 'data.bin': 'binary', 'README': 'text'})
+        self.assertEqual(self.kinds.get(str(self.root))[0], 'other')
+
+    def test_cache(self):
+        kind, _, head = self.kinds.get(str(self.root / 'script'))
+        self.assertEqual(head, self.files['script'])
+        # symlink's target is read only once
+        self.assertEqual(self.kinds.get(str(self.root / 'link')),
+                         (kind, (self.root / 'script').stat().st_mode, head))
+        self.assertEqual(len(self.kinds._kinds), 1)
+        (self.root / 'script').write_bytes(b'#! /usr/bin/python3\n')
+        self.assertEqual(self.kinds.get(str(self.root / 'link'))[2],
+                         b'#! /usr/bin/python3\n')
+
+    def test_elf(self):
+        fpath = self.root / 'foo.so'
+        fpath.write_bytes(build_elf(2, '<', needed=['libpython3.9.so.1.0']))
+        with patch('dhpython.fs.read_elf', wraps=read_elf) as mock:
+            self.assertEqual(self.kinds.elf(str(fpath)).needed,
+                             ['libpython3.9.so.1.0'])
+            fpath.rename(self.root / 'bar.so')
+            # renamed file is not parsed again
+            self.assertEqual(self.kinds.elf(str(self.root / 'bar.so')).needed,
+                             ['libpython3.9.so.1.0'])
+            # other kinds of files are not parsed at all
+            self.assertIsNone(self.kinds.elf(str(self.root / 'README')))
+        self.assertEqual(mock.call_count, 1)
+
+
+class ScanTestCase(TestCase):
+    """Scan package built from files listed in the files dict"""
+    package = 'python3-foo'
+    files = {}
+    executables = set()
+
+    def make_package(self):
+        """Write package's files into a new temporary directory.
+
+        :return: path to this directory (with debian/<package>/ inside)
+        """
+        tempdir = TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        root = Path(tempdir.name)
+        for fn, content in self.files.items():
+            path = root / 'debian' / self.package / fn
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if isinstance(content, bytes):
+                path.write_bytes(content)
+            else:
+                path.write_text(content)
+            if fn in self.executables:
+                path.chmod(0o755)
+        return root
+
+    def scan_package(self, root, private_dirs=None, cls=Scan, **kwargs):
+        """Scan package's files (paths are relative to root)"""
+        cwd = os.getcwd()
+        os.chdir(root)
+        try:
+            return cls(Interpreter('python3'), self.package, private_dirs, **kwargs)
+        finally:
+            os.chdir(cwd)
+
+
+class ScanShebangsTest(ScanTestCase):
+    files = {
+        'usr/bin/foo': '#! /usr/bin/env python3\nimport foo\n',
+        'usr/bin/bar': '#! /bin/sh\n',
+        'usr/share/python3-foo/tool.py': '#! /usr/local/bin/python3.9 -E\n',
+        'usr/share/python3-foo/module.py': '#! /usr/bin/python3\n',
+    }
+    executables = {'usr/bin/foo', 'usr/bin/bar', 'usr/share/python3-foo/tool.py'}
+
+    def scan(self, jobs=1, **options):
+        root = self.make_package()
+        options.setdefault('no_shebang_rewrite', False)
+        options.setdefault('ignore_shebangs', False)
+        options.setdefault('shebang', None)
+        scan = self.scan_package(root, options=FakeOptions(clean_dbg_pkg=True,
+                                                           **options),
+                                 jobs=jobs)
+        contents = {fn: (root / 'debian/python3-foo' / fn).read_text()
+                    for fn in self.files}
+        return scan.result, contents
+
+    def test_rewrite(self):
+        result, contents = self.scan()
+        self.assertEqual({repr(i) for i in result['shebangs']},
+                         {'/usr/bin/python3'})
+        private = result['private_dirs']['/usr/share/python3-foo']
+        self.assertEqual({repr(i) for i in private['shebangs']},
+                         {'/usr/bin/python3.9 -E'})
+        self.assertEqual(contents['usr/bin/foo'],
+                         '#! /usr/bin/python3\nimport foo\n')
+        self.assertEqual(contents['usr/bin/bar'], '#! /bin/sh\n')
+        self.assertEqual(contents['usr/share/python3-foo/tool.py'],
+                         '#! /usr/bin/python3.9 -E\n')
+        # not executable
+        self.assertEqual(contents['usr/share/python3-foo/module.py'],
+                         '#! /usr/bin/python3\n')
+
+    def test_rewrite_in_parallel(self):
+        _, serial = self.scan()
+        with patch('dhpython.fs.rewrite_shebangs',
+                   wraps=rewrite_shebangs) as rewrite:
+            _, parallel = self.scan(jobs=2)
+        self.assertEqual(rewrite.call_args.args[1], 2)
+        self.assertEqual(parallel, serial)
+
+    def test_no_rewrite(self):
+        result, contents = self.scan(no_shebang_rewrite=True)
+        self.assertEqual(contents, self.files)
+        private = result['private_dirs']['/usr/share/python3-foo']
+        self.assertEqual({repr(i) for i in private['shebangs']},
+                         {'/usr/local/bin/python3.9 -E'})
+
+    def test_ignore_shebangs(self):
+        result, contents = self.scan(ignore_shebangs=True)
+        self.assertFalse(result['shebangs'])
+        self.assertFalse(result['private_dirs']
+                         .get('/usr/share/python3-foo', {}).get('shebangs'))
+        # shebangs in private directories are still normalized
+        self.assertEqual(contents['usr/share/python3-foo/tool.py'],
+                         '#! /usr/bin/python3.9 -E\n')
+        self.assertEqual(contents['usr/bin/foo'], self.files['usr/bin/foo'])
+
+
+class ScanPrivateDirsTest(ScanTestCase):
+    package = 'foo'
+    files = {
+        'usr/share/foo/a.py': '',
+        'usr/lib/foo-plugins/b/__init__.py': '',
+        'usr/lib/foo-plugins/b/tool': '#! /usr/bin/python3.11\n',
+        'usr/share/other/c.py': '',
+        'usr/lib/python3/dist-packages/d.py': '',
+        'usr/share/foobar/e.py': '',
+    }
+    executables = {'usr/lib/foo-plugins/b/tool'}
+
+    def scan(self, private_dirs):
+        return self.scan_package(
+            self.make_package(), private_dirs,
+            options=FakeOptions(no_shebang_rewrite=True, ignore_shebangs=False,
+                                clean_dbg_pkg=True)).result
+
+    def test_several_dirs(self):
+        result = self.scan(['/usr/share/foo', 'usr/lib/foo-plugins'])
+        self.assertEqual(sorted(result['private_dirs']),
+                         ['/usr/lib/foo-plugins', '/usr/share/foo'])
+        plugins = result['private_dirs']['/usr/lib/foo-plugins']
+        self.assertTrue(plugins['compile'])
+        self.assertEqual({str(i) for i in plugins['shebangs']}, {'python3.11'})
+        # public directories are not scanned
+        self.assertFalse(result['compile'])
+
+    def test_common_prefix(self):
+        result = self.scan(['/usr/share/foo', '/usr/share/foobar'])
+        self.assertEqual(sorted(result['private_dirs']),
+                         ['/usr/share/foo', '/usr/share/foobar'])
+        self.assertTrue(result['private_dirs']['/usr/share/foobar']['compile'])
+        # /usr/share/foobar is not a subdirectory of /usr/share/foo
+        result = self.scan(['/usr/share/foo'])
+        self.assertEqual(sorted(result['private_dirs']), ['/usr/share/foo'])
+
+
+class ScanManifestTest(ScanTestCase):
+    package = 'foo'
+    files = {
+        'usr/share/foo/a.py': '',
+        'usr/share/foo/tool': '#! /usr/bin/python3.11\n',
+    }
+    executables = {'usr/share/foo/tool'}
+
+    def setUp(self):
+        self.root = self.make_package()
+        self.fpath = str(self.root / 'debian/.debhelper/dh_python3/foo.manifest')
+
+    def scan(self):
+        manifest = Manifest(self.fpath, key='test')
+        scanned = []
+
+        class Scanner(Scan):
+            def scan_files(self, root, file_names, version):
+                scanned.append(root)
+                return super().scan_files(root, file_names, version)
+
+        result = self.scan_package(
+            self.root, ['/usr/share/foo'], cls=Scanner,
+            options=FakeOptions(no_shebang_rewrite=True, ignore_shebangs=False,
+                                clean_dbg_pkg=True, no_ext_rename=False),
+            manifest=manifest).result
+        manifest.save()
+        return result, scanned
+
+    def shebangs(self, result):
+        return {str(i) for i in result['private_dirs']['/usr/share/foo']['shebangs']}
+
+    def test_rerun(self):
+        result, scanned = self.scan()
+        self.assertEqual(scanned, ['debian/foo/usr/share/foo'])
+        self.assertEqual(self.shebangs(result), {'python3.11'})
+        result, scanned = self.scan()
+        self.assertEqual(scanned, [])
+        self.assertEqual(self.shebangs(result), {'python3.11'})
+
+        (self.root / 'debian/foo/usr/share/foo/tool').write_text('#! /usr/bin/python3.12 -E\n')
+        result, scanned = self.scan()
+        self.assertEqual(scanned, ['debian/foo/usr/share/foo'])
+        self.assertEqual(self.shebangs(result), {'python3.12'})
+
+    def test_different_key(self):
+        self.scan()
+        self.assertEqual(Manifest(self.fpath, key='other').previous, {})
+
+
+class ScanExtensionsTest(ScanTestCase):
+    package = 'foo'
+    files = {
+        'usr/share/foo/_foo.so': build_elf(2, '<', defined=['PyInit__foo']),
+        'usr/share/foo/libbar.so': build_elf(2, '<', soname='libbar.so',
+                                             defined=['bar']),
+    }
+
+    def test_shared_libraries(self):
+        result = self.scan_package(
+            self.make_package(), '/usr/share/foo',
+            options=FakeOptions(no_ext_rename=True, clean_dbg_pkg=True)).result
+        # all .so files are handled as extensions, even the ones without
+        # PyInit_* function (f.e. loaded via ctypes)
+        self.assertEqual(result['private_dirs']['/usr/share/foo']['ext_no_version'],
+                         {'debian/foo/usr/share/foo/_foo.so',
+                          'debian/foo/usr/share/foo/libbar.so'})
+
+    def test_stable_abi(self):
+        tempdir = TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        dpath = Path(tempdir.name)
+        (dpath / 'foo.so').write_bytes(build_elf(
+            2, '<', defined=['PyInit_foo'],
+            undefined=['PyModule_Create2', 'PyLong_FromLong']))
+        (dpath / 'bar.so').write_bytes(build_elf(
+            2, '<', defined=['PyInit_bar'],
+            undefined=['PyModule_Create2', 'PyUnicode_New']))
+        interpreter = Interpreter('python3')
+        abi3 = interpreter.stableabi(Version('3.9'))
+        fpath = str(dpath / 'foo.so')
+        # opt-in only, there's no way to tell if Py_LIMITED_API was used
+        self.assertNotIn(abi3, Scan.rename_ext(fpath, interpreter, '3.9'))
+        self.assertEqual(Scan.rename_ext(fpath, interpreter, '3.9', detect_abi3=True),
+                         str(dpath / 'foo.{}.so'.format(abi3)))
+        self.assertNotIn(abi3, Scan.rename_ext(str(dpath / 'bar.so'), interpreter,
+                                               '3.9', detect_abi3=True))
+
+    def test_stable_abi_supported_versions(self):
+        tempdir = TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        fpath = str(Path(tempdir.name) / 'foo.so')
+        interpreter = Interpreter('python3')
+        abi3 = interpreter.stableabi(Version('3.13'))
+        for versions, tagged in (('3.12 3.13', False), ('3.13 3.14', True)):
+            Path(fpath).write_bytes(build_elf(
+                2, '<', defined=['PyInit_foo'],
+                undefined=['PyModule_Create2', 'PyDict_GetItemRef']))
+            # PyDict_GetItemRef was added to the Stable ABI in 3.13
+            with patch('dhpython.fs.supported',
+                       return_value=[Version(i) for i in versions.split()]):
+                new_fpath = Scan.rename_ext(fpath, interpreter, '3.13',
+                                            detect_abi3=True)
+            self.assertEqual(abi3 in new_fpath, tagged, versions)
+            os.remove(new_fpath)
+
+
+class ShareFilesVersionsTest(MergeWheelTestCase):
+    files = {
+        'python3.1/foo.py': ('foo',),
+        'python3.1/bar.py': ('bar',),
+        'python3.2/foo.py': ('foo',),
+        'python3.2/bar.py': ('baz',),
+        'python3.3/foo.py': ('foo',),
+        'python3.3/bar.py': ('bar',),
+    }
+
+    def test_merge(self):
+        temp_path = Path(self.tempdir.name)
+        dstdir = temp_path / 'python3'
+        digests = FileDigests()
+        for version in ('3.1', '3.2'):
+            share_files(str(temp_path / ('python' + version)), str(dstdir),
+                        Interpreter('python' + version),
+                        FakeOptions(verbose=False),
+                        digests)
+        self.assertEqual(sorted(i.name for i in dstdir.iterdir()),
+                         ['bar.py', 'foo.py'])
+        self.assertFalse((temp_path / 'python3.2/foo.py').exists())
+        # files differ, cannot be shared
+        self.assertTrue((temp_path / 'python3.2/bar.py').exists())
+
+    def test_files_read_once(self):
+        temp_path = Path(self.tempdir.name)
+        digests = FileDigests()
+        with patch.object(FileDigests, '_compute', autospec=True,
+                          side_effect=FileDigests._compute) as compute:
+            for version in ('3.1', '3.2', '3.3'):
+                share_files(str(temp_path / ('python' + version)),
+                            str(temp_path / 'python3'),
+                            Interpreter('python' + version),
+                            FakeOptions(verbose=False), digests)
+        self.assertFalse((temp_path / 'python3.3').exists())
+        # files moved to python3 by the first version were not read again
+        self.assertEqual(compute.call_count, len(self.files))
+
+
+class ParallelScan(Scan):
+    PARALLEL_THRESHOLD = 0
+
+
+class UnpicklableScan(ParallelScan):
+    def __reduce_ex__(self, protocol):
+        raise TypeError('Scan should not be sent to worker processes')
+
+
+class ParallelScanTest(ScanTestCase):
+    files = {
+        'usr/lib/python3/dist-packages/foo/__init__.py': '',
+        'usr/lib/python3/dist-packages/foo/bar.pyc': '',
+        'usr/lib/python3/dist-packages/foo/baz/__init__.py': '',
+        'usr/lib/python3/dist-packages/foo.egg-info/requires.txt': '',
+        'usr/share/python3-foo/tool.py': '#! /usr/bin/python3.9\n',
+        'usr/share/python3-foo/data/module.py': '',
+    }
+    executables = {'usr/share/python3-foo/tool.py'}
+    options = FakeOptions(no_shebang_rewrite=True, ignore_shebangs=False,
+                          shebang=None, clean_dbg_pkg=True)
+
+    def scan(self, jobs, cls=Scan):
+        root = self.make_package()
+        scan = self.scan_package(root, cls=cls, options=self.options, jobs=jobs)
+        self.assertFalse((root / 'debian/python3-foo/usr/lib/python3/'
+                          'dist-packages/foo/bar.pyc').exists())
+        result = scan.result
+        for details in result['private_dirs'].values():
+            # Interpreter instances are not comparable
+            details['shebangs'] = {str(i) for i in details['shebangs']}
+        return result
+
+    def test_same_result(self):
+        serial = self.scan(1)
+        self.assertTrue(serial['compile'])
+        self.assertEqual(
+            serial['private_dirs']['/usr/share/python3-foo']['shebangs'],
+            {'python3.9'})
+        # worker processes are used only for big trees by default
+        self.assertEqual(self.scan(4), serial)
+        self.assertEqual(self.scan(4, ParallelScan), serial)
+
+    def test_scan_not_pickled(self):
+        self.assertEqual(self.scan(4, UnpicklableScan), self.scan(1))
+
+
+class DirClassifierTest(TestCase):
+    paths = (
+        'debian/foo',
+        'usr/lib/python3',
+        '/usr/lib/python3',
+        'debian/foo/usr/lib/python3/dist-packages/bar',
+        'debian/foo/usr/lib/python3.12/site-packages',
+        'debian/foo/usr/lib/python3.12x/site-packages',
+        'debian/foo/usr/usr/lib/python3/usr/lib/python3.11',
+        'debian/foo/usr/lib/python2.7',
+        'debian/foo/usr/lib/python2.7/dist-packages',
+        'debian/foo/usr/lib/pypy/dist-packages',
+        'debian/foo/usr/lib/x86_64-linux-gnu',
+        'debian/foo/usr/lib/x86_64-linux-gnu/bar/usr/lib/python3',
+        'x86_64-linux-gnu/foo',
+    )
+
+    def test_same_as_regexes(self):
+        for impl, name in (('cpython3', 'python3'), ('cpython2', 'python2.7'),
+                           ('pypy', 'pypy')):
+            interpreter = Interpreter(name)
+            classifier = DirClassifier(impl)
+            for path in self.paths:
+                expected = (bool(interpreter.should_ignore(path)),
+                            interpreter.parse_public_dir(path),
+                            bool(MULTIARCH_DIR_TPL.match(path)))
+                self.assertEqual(classifier.classify(path), expected,
+                                 '%s: %s' % (impl, path))
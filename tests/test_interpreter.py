@@ -1,13 +1,30 @@
+import json
+import os
+import sys
 import unittest
-from os import environ
-from os.path import exists
-from dhpython.interpreter import Interpreter
+from concurrent.futures import ThreadPoolExecutor
+from importlib.util import MAGIC_NUMBER
+from os import environ, listdir
+from os.path import dirname, exists, join
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+from dhpython.interpreter import (
+    Interpreter, load_probe_cache, probe_cache_path, save_probe_cache)
 
 
 class TestInterpreter(unittest.TestCase):
     def setUp(self):
         self._triplet = environ.get('DEB_HOST_MULTIARCH')
         environ['DEB_HOST_MULTIARCH'] = 'MYARCH'
+        # do not store interpreters' details in user's cache
+        cache_dir = TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        patcher = patch.dict(environ, {'XDG_CACHE_HOME': cache_dir.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # .pybuild/interpreters.json is used if .pybuild exists in cwd
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(cache_dir.name)
 
     def tearDown(self):
         if self._triplet:
@@ -240,6 +257,76 @@ class TestInterpreter(unittest.TestCase):
         self.assertIsNone(i.check_extname('foo.abi3.so'))
         self.assertEqual(i.check_extname('foo/bar/bazmodule.so'), r'foo/bar/baz.cpython-310d-MYARCH.so')
 
+    @unittest.skipUnless(exists('/usr/bin/python%d.%d' % sys.version_info[:2]),
+                         'current Python version is not installed in /usr/bin')
+    def test_probe(self):
+        version = '%d.%d' % sys.version_info[:2]
+        i = Interpreter('python3')
+        i.probe_versions([version, '3.0'])  # missing interpreters are ignored
+        self.assertEqual(i.magic_tag(version), sys.implementation.cache_tag)
+        self.assertEqual(i.magic_number(version), MAGIC_NUMBER)
+        self.assertTrue(i._probe(version)['EXT_SUFFIX'].endswith('.so'))
+
+        # details are reused by other processes
+        Interpreter._cache.clear()
+        with patch('dhpython.interpreter.execute') as execute:
+            self.assertEqual(i.magic_number(version), MAGIC_NUMBER)
+            self.assertFalse(execute.called)
+
+        # unless the interpreter was upgraded
+        fpath = probe_cache_path()
+        with open(fpath, encoding='utf-8') as fp:
+            data = json.load(fp)
+        for entry in data.values():
+            entry['stat'][0] += 1
+            entry['result']['MAGIC_NUMBER'] = '00000000'
+        with open(fpath, 'w', encoding='utf-8') as fp:
+            json.dump(data, fp)
+        Interpreter._cache.clear()
+        self.assertEqual(i.magic_number(version), MAGIC_NUMBER)
+
+    def test_concurrent_probe_cache_saves(self):
+        with ThreadPoolExecutor(8) as executor:
+            list(executor.map(lambda i: save_probe_cache(str(i), {'result': i}),
+                              range(32)))
+        self.assertEqual(load_probe_cache(),
+                         {str(i): {'result': i} for i in range(32)})
+        # no temporary files left behind
+        self.assertEqual(listdir(dirname(probe_cache_path())), ['interpreters.json'])
+
+    @unittest.skipUnless(exists('/usr/bin/python%d.%d' % sys.version_info[:2]),
+                         'current Python version is not installed in /usr/bin')
+    def test_sysconfigdata(self):
+        version = '%d.%d' % sys.version_info[:2]
+        i = Interpreter('python3')
+        expected = i._probe(version, static=False)
+        environ['DEB_HOST_MULTIARCH'] = expected['MULTIARCH']
+        Interpreter._cache.clear()
+        with patch('dhpython.interpreter.load_probe_cache', return_value={}), \
+                patch('dhpython.interpreter.execute') as execute:
+            result = i._probe(version)
+            self.assertFalse(execute.called)
+        self.assertIsNone(result.pop('MAGIC_NUMBER'))
+        del expected['MAGIC_NUMBER']
+        self.assertEqual(result, expected)
+
+    def test_sysconfigdata_without_interpreter(self):
+        i = Interpreter('python3')
+        self.assertFalse(exists(i.binary('3.99')))
+        with TemporaryDirectory() as dpath:
+            os.mkdir(join(dpath, 'python3.99'))
+            with open(join(dpath, 'python3.99', '_sysconfigdata__MYARCH.py'), 'w') as fp:
+                fp.write("build_time_vars = {'SOABI': 'cpython-399-MYARCH',\n"
+                         "                   'MULTIARCH': 'MYARCH',\n"
+                         "                   'EXT_SUFFIX': '.cpython-399-MYARCH.so'}\n")
+            with patch('dhpython.interpreter.SYSCONFIGDATA_DIR_TPL',
+                       join(dpath, 'python{}')):
+                self.assertEqual(i.magic_tag('3.99'), 'cpython-399')
+                self.assertEqual(i.soabi('3.99'), 'cpython-399')
+        # the interpreter is still required if the file cannot be read
+        Interpreter._cache.clear()
+        with self.assertRaisesRegex(Exception, 'missing interpreter'):
+            i._probe('3.99')
 
     def test_version(self):
         i = Interpreter(impl='cpython2')
@@ -0,0 +1,132 @@
+import os
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from zipfile import ZipFile
+
+from dhpython.build import plugin_pyproject
+from dhpython.build.plugin_pyproject import (
+    BuildSystem, is_compatible_wheel, is_pure_wheel)
+from dhpython.interpreter import Interpreter
+from dhpython.version import Version
+
+
+def build_wheel(dpath, name, purelib=True, files=('foo/__init__.py',)):
+    """Write a minimal wheel into dpath, return its path."""
+    path = Path(dpath) / name
+    dist_info = '-'.join(name.split('-')[:2]) + '.dist-info'
+    with ZipFile(path, 'w') as zfile:
+        for fn in files:
+            zfile.writestr(fn, '')
+        zfile.writestr(dist_info + '/METADATA',
+                       'Metadata-Version: 2.1\nName: foo\nVersion: 1.0\n')
+        zfile.writestr(dist_info + '/WHEEL',
+                       'Wheel-Version: 1.0\nRoot-Is-Purelib: {}\n'
+                       .format('true' if purelib else 'false'))
+        zfile.writestr(dist_info + '/RECORD', '')
+    return path
+
+
+class PyProjectTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.plugin = BuildSystem(cfg=None)
+
+    def args(self, version):
+        home_dir = os.path.join(self.tmpdir.name, version)
+        os.makedirs(home_dir, exist_ok=True)
+        return {'home_dir': home_dir,
+                'build_dir': os.path.join(home_dir, 'build'),
+                'destdir': os.path.join(self.tmpdir.name, 'destdir'),
+                'install_dir': '/usr/lib/python3/dist-packages',
+                'interpreter': Interpreter('python' + version),
+                'version': Version(version),
+                'args': ''}
+
+
+class TestWheelSelection(PyProjectTestCase):
+    def test_is_compatible_wheel(self):
+        for name, compatible in (
+                ('foo-1.0-py3-none-any.whl', {'3.9', '3.10', '3.11', '3.12', '3.13'}),
+                ('foo-1.0-cp312-cp312-linux_x86_64.whl', {'3.12'}),
+                ('foo-1.0-cp311-abi3-linux_x86_64.whl', {'3.11', '3.12', '3.13'}),
+                ('foo-1.0-1-cp310.cp311-cp310.cp311-linux_x86_64.whl', {'3.10', '3.11'}),
+                ('foo.whl', set())):
+            for version in ('3.9', '3.10', '3.11', '3.12', '3.13'):
+                self.assertEqual(is_compatible_wheel(Path(name), Version(version)),
+                                 version in compatible, (name, version))
+
+    def test_select_wheel(self):
+        args = self.args('3.12')
+        with self.assertRaisesRegex(Exception, 'cannot find a wheel'):
+            self.plugin.select_wheel(args)
+        build_wheel(args['home_dir'], 'foo-1.0-cp311-cp311-linux_x86_64.whl')
+        wheel = build_wheel(args['home_dir'], 'foo-1.0-cp312-cp312-linux_x86_64.whl')
+        self.assertEqual(self.plugin.select_wheel(args), wheel)
+        # the newest compatible one wins
+        newer = build_wheel(args['home_dir'], 'foo-1.0-py3-none-any.whl')
+        os.utime(wheel, (0, 0))
+        with self.assertLogs('dhpython', 'WARNING'):
+            self.assertEqual(self.plugin.select_wheel(args), newer)
+
+    def test_select_unknown_wheel(self):
+        args = self.args('3.12')
+        build_wheel(args['home_dir'], 'UNKNOWN-0.0.0-py3-none-any.whl')
+        with self.assertRaisesRegex(Exception, 'UNKNOWN wheel'):
+            self.plugin.select_wheel(args)
+
+
+class TestPureWheel(PyProjectTestCase):
+    def test_is_pure_wheel(self):
+        dpath = self.tmpdir.name
+        self.assertTrue(is_pure_wheel(build_wheel(dpath, 'foo-1.0-py3-none-any.whl')))
+        self.assertTrue(is_pure_wheel(build_wheel(dpath, 'foo-1.0-py2.py3-none-any.whl')))
+        # platlib wheel, even with pure Python tags
+        self.assertFalse(is_pure_wheel(build_wheel(dpath, 'bar-1.0-py3-none-any.whl',
+                                                   purelib=False)))
+        self.assertFalse(is_pure_wheel(build_wheel(
+            dpath, 'baz-1.0-cp312-cp312-linux_x86_64.whl', purelib=False)))
+        self.assertFalse(is_pure_wheel(build_wheel(dpath, 'spam-1.0-py3-abi3-any.whl')))
+
+    def test_reuse(self):
+        args311, args312 = self.args('3.11'), self.args('3.12')
+        self.assertFalse(self.plugin.reuse_pure_wheel({}, args312))
+        wheel = build_wheel(args311['home_dir'], 'foo-1.0-py3-none-any.whl')
+        self.plugin.remember_pure_wheel({}, args311)
+        with self.assertLogs('dhpython', 'INFO'):
+            self.assertTrue(self.plugin.reuse_pure_wheel({}, args312))
+        reused = Path(args312['home_dir'], wheel.name)
+        self.assertEqual(reused.read_bytes(), wheel.read_bytes())
+        # different arguments passed to the build module
+        self.assertFalse(self.plugin.reuse_pure_wheel({}, dict(args312, args='-C foo')))
+
+    def test_platlib_not_reused(self):
+        args311, args312 = self.args('3.11'), self.args('3.12')
+        build_wheel(args311['home_dir'], 'foo-1.0-cp311-cp311-linux_x86_64.whl',
+                    purelib=False)
+        self.plugin.remember_pure_wheel({}, args311)
+        self.assertFalse(self.plugin.reuse_pure_wheel({}, args312))
+
+
+class TestStaging(PyProjectTestCase):
+    def test_install_copies_files(self):
+        args = self.args('3.12')
+        staged = Path(args['home_dir'], 'install/usr/lib/python3/dist-packages/foo.py')
+        staged.parent.mkdir(parents=True)
+        staged.write_text('foo')
+        self.plugin.install({}, args)
+        installed = Path(args['destdir'], 'usr/lib/python3/dist-packages/foo.py')
+        self.assertEqual(installed.read_text(), 'foo')
+        self.assertNotEqual(installed.stat().st_ino, staged.stat().st_ino)
+
+    @unittest.skipUnless(plugin_pyproject.install, 'installer module is not available')
+    def test_rebuild_replaces_staging_tree(self):
+        args = self.args('3.12')
+        build_wheel(args['home_dir'], 'foo-1.0-py3-none-any.whl')
+        stale = Path(args['home_dir'], 'install/usr/lib/python3/dist-packages/stale.py')
+        stale.parent.mkdir(parents=True)
+        stale.write_text('')
+        self.plugin.build_step2({}, args)
+        self.assertFalse(stale.exists())
+        self.assertTrue(Path(args['build_dir'], 'foo/__init__.py').exists())
@@ -0,0 +1,190 @@
+from os.path import dirname, join
+from subprocess import run, PIPE, STDOUT
+from tempfile import TemporaryDirectory
+import json
+import os
+import sys
+import unittest
+
+TOP_DIR = dirname(dirname(os.path.abspath(__file__)))
+STEPS = ('clean', 'configure', 'build', 'install', 'test')
+
+
+class PybuildTestCase(unittest.TestCase):
+    """Invoke pybuild's custom build system with commands that log steps"""
+    versions = ('3.11',)
+
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        os.makedirs(self.path('src', 'foo'))
+        self.write('src/foo/__init__.py', 'foo')
+        # outside of the source tree, it's not an input of any step
+        self.log_fpath = self.path('steps.log')
+
+    def path(self, *parts):
+        return join(self.tmpdir.name, *parts)
+
+    def write(self, fn, content, mode='w'):
+        with open(self.path(fn), mode) as fp:
+            fp.write(content)
+
+    def pybuild(self, *args, steps=STEPS, returncode=0, system='custom', **env):
+        argv = [sys.executable, join(TOP_DIR, 'pybuild'),
+                '--dest-dir', self.path('destdir')]
+        if system:
+            argv.extend(('--system', system))
+        for version in self.versions:
+            argv.extend(('-p', version))
+        for step in steps:
+            argv.append('--{}-args=echo {{version}} {} >> {}'.format(
+                step, step, self.log_fpath))
+        argv.extend(args)
+        env = dict(os.environ, PYTHONPATH=TOP_DIR, **env)
+        for name in ('DEB_BUILD_OPTIONS', 'PYBUILD_VERBOSE', 'PYBUILD_QUIET'):
+            env.pop(name, None)
+        result = run(argv, cwd=self.path('src'), env=env, stdout=PIPE,
+                     stderr=STDOUT, universal_newlines=True)
+        self.assertEqual(result.returncode, returncode, result.stdout)
+        return result.stdout
+
+    def steps(self):
+        """Return (version, step) pairs in the order they were invoked"""
+        if not os.path.exists(self.log_fpath):
+            return []
+        with open(self.log_fpath) as fp:
+            return [tuple(line.split()) for line in fp]
+
+
+class TestStamps(PybuildTestCase):
+
+    def test_up_to_date(self):
+        self.pybuild('--build', steps=('build',))
+        output = self.pybuild('--build', steps=('build',))
+        self.assertIn('build step for python3.11 is up to date', output)
+        self.assertEqual(self.steps(), [('3.11', 'build')])
+
+    def test_source_changed(self):
+        self.pybuild('--build', steps=('build',))
+        self.write('src/foo/__init__.py', 'bar', mode='a')
+        self.pybuild('--build', steps=('build',))
+        self.assertEqual(self.steps(), [('3.11', 'build')] * 2)
+
+    def test_command_changed(self):
+        self.pybuild('--build', steps=('build',))
+        self.pybuild('--build', '--build-args=echo 3.11 rebuild >> {}'.format(
+            self.log_fpath), steps=())
+        self.assertEqual(self.steps(), [('3.11', 'build'), ('3.11', 'rebuild')])
+
+    def test_force(self):
+        self.pybuild('--build', steps=('build',))
+        self.pybuild('--build', '--force', steps=('build',))
+        self.assertEqual(self.steps(), [('3.11', 'build')] * 2)
+
+    def test_build_dir_outside_home_dir(self):
+        # nothing else creates .pybuild/cpython3_3.11 then
+        build_dir = self.path('build')
+        self.pybuild('--build', steps=('build',), PYBUILD_BUILD_DIR=build_dir)
+        output = self.pybuild('--build', steps=('build',),
+                              PYBUILD_BUILD_DIR=build_dir)
+        self.assertIn('build step for python3.11 is up to date', output)
+
+    def test_clean_removes_stamps(self):
+        self.pybuild('--build', steps=('build',))
+        self.pybuild('--clean', steps=('clean',))
+        self.pybuild('--build', steps=('build',))
+        self.assertEqual(self.steps(), [('3.11', 'build'), ('3.11', 'clean'),
+                                        ('3.11', 'build')])
+
+
+class TestParallel(PybuildTestCase):
+    versions = ('3.11', '3.12', '3.13')
+
+    def test_step_order(self):
+        self.pybuild('--parallel', '2')
+        steps = self.steps()
+        self.assertEqual(len(steps), len(self.versions) * len(STEPS))
+        # clean steps share the source directory with all other steps
+        last_clean = max(n for n, (_, step) in enumerate(steps)
+                         if step == 'clean')
+        first_other = min(n for n, (_, step) in enumerate(steps)
+                          if step != 'clean')
+        self.assertLess(last_clean, first_other)
+        # steps of each version are invoked in the usual order
+        for version in self.versions:
+            self.assertEqual([step for v, step in steps if v == version],
+                             list(STEPS))
+
+    def test_install_order(self):
+        self.pybuild()
+        serial = [s for s in self.steps() if s[1] == 'install']
+        os.remove(self.log_fpath)
+        self.pybuild('--parallel', '3', '--force')
+        self.assertEqual([s for s in self.steps() if s[1] == 'install'], serial)
+
+
+@unittest.skipUnless((os.cpu_count() or 1) > 1,
+                     'test steps are not invoked in parallel on a single CPU')
+class TestParallelTests(PybuildTestCase):
+    versions = ('3.11', '3.12', '3.13')
+
+    def test_test_output(self):
+        output = self.pybuild('--test', '--parallel', '2',
+                              '--test-args=echo tested {version}', steps=())
+        for version in self.versions:
+            self.assertIn('python{0}: tested {0}\n'.format(version), output)
+
+    def test_test_failure(self):
+        output = self.pybuild(
+            '--test', '--parallel', '2',
+            '--test-args=echo {version} test >> %s; test {version} != 3.12' %
+            self.log_fpath, steps=(), returncode=13)
+        self.assertIn('test: plugin custom failed for python3.12', output)
+        # other versions are tested anyway
+        self.assertEqual(sorted(self.steps()),
+                         [(version, 'test') for version in self.versions])
+
+
+CONTROL = '''Source: foo
+{}
+Package: python3-foo
+Architecture: all
+'''
+
+
+class TestDetectCache(PybuildTestCase):
+
+    def setUp(self):
+        super().setUp()
+        os.makedirs(self.path('src', 'debian'))
+        self.write('src/debian/control', CONTROL.format(''))
+        self.write('src/setup.py', 'from setuptools import setup\nsetup()\n')
+
+    def detect(self):
+        return self.pybuild('--print', 'build_dir', '--verbose', steps=(),
+                            system=None)
+
+    def test_cached(self):
+        self.assertIn('detected build system: distutils', self.detect())
+        with open(self.path('src/.pybuild/detect.json')) as fp:
+            self.assertEqual(json.load(fp)['plugin'], 'distutils')
+        self.assertIn('using detection results cached', self.detect())
+
+    def test_new_file(self):
+        self.detect()
+        self.write('src/pyproject.toml', '')
+        self.assertIn('ignoring outdated', self.detect())
+
+    def test_modified_control(self):
+        self.detect()
+        self.write('src/debian/control',
+                   CONTROL.format('Build-Depends: pybuild-plugin-pyproject\n'))
+        # make sure mtime differs even on file systems with coarse timestamps
+        os.utime(self.path('src/debian/control'), ns=(0, 0))
+        output = self.detect()
+        self.assertIn('ignoring outdated', output)
+        self.assertIn('detected build system: pyproject', output)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+from threading import Event, Lock
+import unittest
+
+from dhpython.build.scheduler import Scheduler
+
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.lock = Lock()
+        self.log = []
+
+    def task(self, key):
+        with self.lock:
+            self.log.append(key)
+
+    def test_serial_mode_keeps_order(self):
+        s = Scheduler(jobs=1)
+        for key in ('a', 'b', 'c'):
+            s.add(key, self.task, key)
+        s.run()
+        self.assertEqual(self.log, ['a', 'b', 'c'])
+
+    def test_dependencies(self):
+        s = Scheduler(jobs=4)
+        s.add('clean', self.task, 'clean')
+        s.add('build1', self.task, 'build1', deps=['clean'])
+        s.add('build2', self.task, 'build2', deps=['clean'])
+        s.add('install1', self.task, 'install1', deps=['build1'])
+        s.add('install2', self.task, 'install2', deps=['build2', 'install1'])
+        s.run()
+        self.assertEqual(len(self.log), 5)
+        for before, after in (('clean', 'build1'), ('clean', 'build2'),
+                              ('build1', 'install1'), ('build2', 'install2'),
+                              ('install1', 'install2')):
+            self.assertLess(self.log.index(before), self.log.index(after))
+
+    def test_tasks_run_at_the_same_time(self):
+        started = Event()
+
+        def wait_for_other():
+            self.assertTrue(started.wait(5))
+
+        s = Scheduler(jobs=2)
+        s.add('a', wait_for_other)
+        s.add('b', started.set)
+        s.run()
+
+    def test_failure_stops_scheduling(self):
+        def fail():
+            raise ValueError('failed')
+
+        s = Scheduler(jobs=2)
+        s.add('a', fail)
+        s.add('b', self.task, 'b', deps=['a'])
+        with self.assertRaises(ValueError):
+            s.run()
+        self.assertEqual(self.log, [])
+
+    def test_unknown_dependency(self):
+        s = Scheduler()
+        with self.assertRaises(ValueError):
+            s.add('a', self.task, 'a', deps=['b'])
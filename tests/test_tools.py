@@ -1,8 +1,13 @@
 from tempfile import TemporaryDirectory
+from unittest.mock import patch
 import os
+import sys
 import unittest
 
-from dhpython.tools import relpath, move_matching_files
+from dhpython.tools import (
+    digest_tree, execute, fix_shebang, relpath, move_matching_files,
+    parallel_jobs, rewrite_shebang, rewrite_shebangs, transfer_file,
+    transfer_tree)
 
 
 class TestRelpath(unittest.TestCase):
@@ -42,3 +47,224 @@ class TestMoveMatchingFiles(unittest.TestCase):
     def test_left_non_matching_file(self):
         self.assertTrue(os.path.exists(
             self.tmppath('foo/bar/a/b/c/spam/file.py')))
+
+
+class TestParallelJobs(unittest.TestCase):
+    @patch.dict(os.environ, {'DEB_BUILD_OPTIONS': 'nocheck parallel=4'})
+    def test_deb_build_options(self):
+        self.assertEqual(parallel_jobs(), 4)
+
+    @patch.dict(os.environ, {'DEB_BUILD_OPTIONS': 'parallel=4'})
+    def test_limited_by_deb_build_options(self):
+        self.assertEqual(parallel_jobs(8), 4)
+        self.assertEqual(parallel_jobs(2), 2)
+
+    @patch.dict(os.environ, {'DEB_BUILD_OPTIONS': 'nocheck'})
+    def test_requested(self):
+        self.assertEqual(parallel_jobs(3), 3)
+
+    @patch.dict(os.environ, {'DEB_BUILD_OPTIONS': ''})
+    @patch('os.cpu_count', return_value=None)
+    def test_at_least_one_job(self, cpu_count):
+        self.assertEqual(parallel_jobs(), 1)
+
+
+class TestExecute(unittest.TestCase):
+    def test_output(self):
+        output = execute('echo foo; echo bar >&2; exit 3')
+        self.assertEqual(output['returncode'], 3)
+        self.assertEqual(output['stdout'], 'foo\n')
+        self.assertEqual(output['stderr'], 'bar\n')
+
+    def test_stats(self):
+        stats = execute('true')['stats']
+        self.assertGreaterEqual(stats['wall'], 0)
+        for key in ('utime', 'stime', 'maxrss', 'inblock', 'oublock'):
+            self.assertIn(key, stats)
+        self.assertGreater(stats['maxrss'], 0)
+
+    def test_stats_of_each_output_mode(self):
+        with TemporaryDirectory() as tmpdir:
+            log_fpath = os.path.join(tmpdir, 'log')
+            for log_output, prefix in ((None, None), (False, None),
+                                       (False, 'foo: '), (log_fpath, None)):
+                with self.subTest(log_output=log_output, prefix=prefix):
+                    output = execute('exit 3', log_output=log_output,
+                                     prefix=prefix)
+                    self.assertEqual(output['returncode'], 3)
+                    self.assertGreater(output['stats']['maxrss'], 0)
+
+    def test_stats_of_finished_command_only(self):
+        cpu_bound = '{} -c "sum(range(10 ** 7))"'.format(sys.executable)
+        self.assertGreater(execute(cpu_bound)['stats']['utime'], 0)
+        self.assertLess(execute('true')['stats']['utime'], 0.1)
+
+    def test_killed(self):
+        self.assertEqual(execute('kill -9 $$')['returncode'], -9)
+
+
+class TestDigestTree(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        os.makedirs(self.path('pkg/__pycache__'))
+        for fn in ('setup.py', 'pkg/__init__.py', 'pkg/__pycache__/x.pyc'):
+            with open(self.path(fn), 'w') as fp:
+                fp.write('foo')
+
+    def path(self, fn):
+        return os.path.join(self.tmpdir.name, fn)
+
+    def test_missing_dir(self):
+        self.assertIsNone(digest_tree(self.path('missing')))
+
+    def test_unchanged(self):
+        self.assertEqual(digest_tree(self.tmpdir.name),
+                         digest_tree(self.tmpdir.name))
+
+    def test_changed(self):
+        digest = digest_tree(self.tmpdir.name)
+        with open(self.path('pkg/__init__.py'), 'a') as fp:
+            fp.write('bar')
+        self.assertNotEqual(digest_tree(self.tmpdir.name), digest)
+
+    def test_exclude(self):
+        exclude = ('*/__pycache__',)
+        digest = digest_tree(self.tmpdir.name, exclude)
+        os.remove(self.path('pkg/__pycache__/x.pyc'))
+        self.assertEqual(digest_tree(self.tmpdir.name, exclude), digest)
+
+    def test_removed_while_walking(self):
+        removed = self.path('pkg/__init__.py')
+        lstat = os.lstat
+
+        def fake_lstat(fpath):
+            if fpath == removed:
+                raise FileNotFoundError(fpath)
+            return lstat(fpath)
+
+        with patch('os.lstat', fake_lstat):
+            digest = digest_tree(self.tmpdir.name)
+        os.remove(removed)
+        self.assertEqual(digest_tree(self.tmpdir.name), digest)
+
+
+class TestTransfer(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        os.makedirs(self.path('src/pkg'))
+        for fn in ('src/pkg/__init__.py', 'src/pkg/data.txt'):
+            with open(self.path(fn), 'w') as fp:
+                fp.write(fn)
+        os.chmod(self.path('src/pkg/data.txt'), 0o600)
+
+    def path(self, fn):
+        return os.path.join(self.tmpdir.name, fn)
+
+    def test_file_without_link(self):
+        src, dst = self.path('src/pkg/data.txt'), self.path('data.txt')
+        self.assertIn(transfer_file(src, dst, link=False), {'reflink', 'copy'})
+        self.assertNotEqual(os.stat(src).st_ino, os.stat(dst).st_ino)
+        self.assertEqual(os.stat(dst).st_mode & 0o777, 0o600)
+        with open(dst) as fp:
+            self.assertEqual(fp.read(), 'src/pkg/data.txt')
+
+    def test_file_replaced(self):
+        src, dst = self.path('src/pkg/data.txt'), self.path('data.txt')
+        with open(dst, 'w') as fp:
+            fp.write('old')
+        transfer_file(src, dst)
+        with open(dst) as fp:
+            self.assertEqual(fp.read(), 'src/pkg/data.txt')
+
+    @patch('dhpython.tools._noreflink_devices', set())
+    def test_file_error(self):
+        src, dst = self.path('src/pkg/data.txt'), self.path('missing/data.txt')
+        with self.assertRaises(FileNotFoundError) as cm:
+            transfer_file(src, dst)
+        # not raised while removing dst that reflink failed to create
+        self.assertIsNone(cm.exception.__context__)
+
+    def test_tree_merge(self):
+        os.makedirs(self.path('dst/pkg'))
+        with open(self.path('dst/pkg/other.py'), 'w') as fp:
+            fp.write('')
+        result = transfer_tree(self.path('src'), self.path('dst'))
+        self.assertEqual(sum(result.values()), 2)
+        self.assertEqual(sorted(os.listdir(self.path('dst/pkg'))),
+                         ['__init__.py', 'data.txt', 'other.py'])
+        self.assertTrue(os.path.exists(self.path('src/pkg/__init__.py')))
+
+    def test_tree_move(self):
+        result = transfer_tree(self.path('src'), self.path('dst/src'), move=True)
+        self.assertEqual(result, {'rename': 1})
+        self.assertFalse(os.path.exists(self.path('src')))
+        self.assertTrue(os.path.exists(self.path('dst/src/pkg/data.txt')))
+
+
+class TestRewriteShebang(unittest.TestCase):
+    content = '#! /usr/bin/env python3\n' + 'print(1)\n' * 10000
+
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.fpath = os.path.join(self.tmpdir.name, 'foo')
+        with open(self.fpath, 'w') as fp:
+            fp.write(self.content)
+        os.chmod(self.fpath, 0o750)
+
+    def read(self, fpath=None):
+        with open(fpath or self.fpath) as fp:
+            return fp.read()
+
+    def test_same_length(self):
+        inode = os.stat(self.fpath).st_ino
+        rewrite_shebang(self.fpath, '/usr/bin/python3 -Es')
+        self.assertEqual(os.stat(self.fpath).st_ino, inode)
+        self.assertEqual(self.read(), self.content.replace(
+            '/usr/bin/env python3', '/usr/bin/python3 -Es'))
+
+    def test_different_length(self):
+        rewrite_shebang(self.fpath, '/usr/bin/python3')
+        self.assertEqual(self.read(), self.content.replace(
+            '/usr/bin/env python3', '/usr/bin/python3'))
+        self.assertEqual(os.stat(self.fpath).st_mode & 0o777, 0o750)
+        self.assertEqual(os.listdir(self.tmpdir.name), ['foo'])
+
+    def test_hard_link(self):
+        link = os.path.join(self.tmpdir.name, 'bar')
+        os.link(self.fpath, link)
+        rewrite_shebang(self.fpath, '/usr/bin/python3 -Es')
+        self.assertEqual(self.read(link), self.content)
+        self.assertNotEqual(self.read(), self.content)
+
+    def test_fix_shebang(self):
+        self.assertTrue(fix_shebang(self.fpath))
+        self.assertTrue(self.read().startswith('#! /usr/bin/python3\n'))
+
+    def test_batch(self):
+        fpaths = [self.fpath]
+        for i in range(3):
+            fpaths.append(os.path.join(self.tmpdir.name, str(i)))
+            with open(fpaths[-1], 'w') as fp:
+                fp.write('#!/bin/python%d\n' % i)
+        rewrite_shebangs([(fpath, '/usr/bin/python3') for fpath in fpaths],
+                         jobs=2)
+        for fpath in fpaths:
+            self.assertTrue(self.read(fpath).startswith('#! /usr/bin/python3\n'))
+
+    def test_symlink(self):
+        link = os.path.join(self.tmpdir.name, 'bar')
+        os.symlink('foo', link)
+        self.assertEqual(rewrite_shebangs([(link, '/usr/bin/python3'),
+                                           (self.fpath, '/usr/bin/python3')]), 0)
+        self.assertTrue(os.path.islink(link))
+        self.assertTrue(self.read().startswith('#! /usr/bin/python3\nprint(1)'))
+
+    def test_errors(self):
+        missing = os.path.join(self.tmpdir.name, 'missing')
+        with self.assertLogs('dhpython', 'ERROR'):
+            self.assertEqual(rewrite_shebangs([(missing, '/usr/bin/python3'),
+                                               (self.fpath, '/usr/bin/python3')]), 1)
+        self.assertTrue(self.read().startswith('#! /usr/bin/python3\n'))
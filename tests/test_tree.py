@@ -0,0 +1,80 @@
+from tempfile import TemporaryDirectory
+import os
+import unittest
+
+from dhpython.tree import TreeIndex
+
+
+class TestTreeIndex(unittest.TestCase):
+    files = ('foo/__init__.py', 'foo/bar.py', 'foo/sub/baz.py',
+             'foo/.hidden', 'egg.egg-info/PKG-INFO')
+
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        for fn in self.files:
+            fpath = self.path(fn)
+            os.makedirs(os.path.dirname(fpath), exist_ok=True)
+            with open(fpath, 'w') as fp:
+                fp.write(fn)
+        os.symlink('sub', self.path('foo/link'))
+        os.symlink('missing', self.path('foo/dangling'))
+        self.tree = TreeIndex(self.tmpdir.name)
+
+    def path(self, fn=''):
+        return os.path.join(self.tmpdir.name, fn)
+
+    def walk(self, top='', topdown=True):
+        return [(os.path.relpath(root, self.path()), sorted(dirs), sorted(files))
+                for root, dirs, files in self.tree.walk(self.path(top), topdown)]
+
+    def test_walk(self):
+        expected = [(os.path.relpath(root, self.path()), sorted(dirs), sorted(files))
+                    for root, dirs, files in os.walk(self.path())]
+        self.assertEqual(self.walk(), expected)
+        self.assertEqual(self.walk(topdown=False)[-1][0], '.')
+
+    def test_queries(self):
+        self.assertTrue(self.tree.isdir(self.path('foo/link')))
+        self.assertTrue(self.tree.islink(self.path('foo/link')))
+        self.assertFalse(self.tree.isdir(self.path('foo/bar.py')))
+        self.assertTrue(self.tree.lexists(self.path('foo/dangling')))
+        self.assertFalse(self.tree.exists(self.path('foo/dangling')))
+        self.assertFalse(self.tree.exists(self.path('foo/missing')))
+        self.assertEqual(self.tree.listdir(self.path('foo/sub')), ['baz.py'])
+        with self.assertRaises(FileNotFoundError):
+            self.tree.listdir(self.path('missing'))
+
+    def test_glob(self):
+        self.assertEqual(self.tree.glob(self.path('foo/*.py')),
+                         [self.path('foo/__init__.py'), self.path('foo/bar.py')])
+        self.assertEqual(self.tree.glob(self.path('*/PKG-INFO')),
+                         [self.path('egg.egg-info/PKG-INFO')])
+        self.assertEqual(self.tree.glob(self.path('foo/.h*')),
+                         [self.path('foo/.hidden')])
+        self.assertEqual(self.tree.glob(self.path('foo/sub')),
+                         [self.path('foo/sub')])
+
+    def test_changes(self):
+        self.tree.renames(self.path('foo/sub/baz.py'), self.path('new/dir/baz.py'))
+        self.assertTrue(os.path.exists(self.path('new/dir/baz.py')))
+        self.assertFalse(os.path.exists(self.path('foo/sub')))
+        self.tree.remove(self.path('foo/bar.py'))
+        self.tree.rename(self.path('egg.egg-info'), self.path('Egg.egg-info'))
+        self.tree.makedirs(self.path('a/b'))
+        self.tree.link(self.path('foo/__init__.py'), self.path('a/b/c.py'))
+        self.tree.rmtree(self.path('foo'))
+        with self.assertRaises(OSError):
+            self.tree.removedirs(self.path('a/b'))
+        # index is still in sync with the file system
+        indexed = sorted(self.walk())
+        self.tree = TreeIndex(self.tmpdir.name)
+        self.assertEqual(indexed, sorted(self.walk()))
+        self.assertEqual([i[0] for i in indexed],
+                         ['.', 'Egg.egg-info', 'a', 'a/b', 'new', 'new/dir'])
+
+    def test_removedirs(self):
+        self.tree.remove(self.path('foo/sub/baz.py'))
+        self.tree.removedirs(self.path('foo/sub'))
+        self.assertFalse(self.tree.lexists(self.path('foo/sub')))
+        self.assertTrue(os.path.isdir(self.path('foo')))